@@ -0,0 +1,415 @@
+"""Benchmarks for Deep Zoom image (DZI) and collection (DZC) generation.
+
+Runs offline on synthetic images, each case in a fresh process, and reports
+wall time, tiles per second, peak memory and bytes written as JSON. Results can
+be compared against a baseline from an earlier run:
+
+    python benchmarks/benchmark.py --output baseline.json
+    python benchmarks/benchmark.py --baseline baseline.json
+"""
+
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import optparse
+
+import PIL
+import PIL.Image
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import deepzoom
+
+# Side of the pattern that synthetic images are scaled up from
+PATTERN_SIZE = 1024
+COLLECTION_ITEM_SIZE = (640, 480)
+
+
+def image_case(
+    megapixels,
+    mode="RGB",
+    tile_format="jpg",
+    tile_size=254,
+    source_format="tif",
+    **options
+):
+    name = "image-%smp-%s-%s-%s" % (megapixels, mode, tile_format, tile_size)
+    if source_format != "tif":
+        name += "-from-%s" % source_format
+    for (key, value) in sorted(options.items()):
+        name += "-%s=%s" % (key, value)
+    return {
+        "name": name,
+        "kind": "image",
+        "megapixels": megapixels,
+        "mode": mode,
+        "tile_format": tile_format,
+        "tile_size": tile_size,
+        "source_format": source_format,
+        "options": options,
+    }
+
+
+def collection_case(items, tile_format="jpg", workers=1):
+    name = "collection-%s-%s-workers=%s" % (items, tile_format, workers)
+    return {
+        "name": name,
+        "kind": "collection",
+        "items": items,
+        "tile_format": tile_format,
+        "workers": workers,
+    }
+
+
+SUITES = {
+    "quick": [
+        image_case(1),
+        image_case(1, mode="RGBA", tile_format="png"),
+        image_case(1, mode="L"),
+        image_case(4),
+        image_case(4, tile_size=510),
+        image_case(4, tile_format="png"),
+        image_case(4, resize_filter="bicubic"),
+        image_case(4, resize_filter="bilinear"),
+        image_case(4, resize_filter="nearest"),
+        image_case(4, dedup=True),
+        image_case(16),
+        image_case(16, cascade=True),
+        image_case(16, streaming=True),
+        image_case(16, source_format="jpg"),
+        image_case(16, source_format="jpg", draft=True),
+        collection_case(50),
+        collection_case(200),
+        collection_case(200, tile_format="png"),
+    ],
+}
+SUITES["full"] = SUITES["quick"] + [
+    image_case(16, mode="RGBA", tile_format="png"),
+    image_case(16, mode="L"),
+    image_case(100),
+    image_case(100, cascade=True),
+    image_case(100, streaming=True),
+    image_case(500, cascade=True),
+    image_case(500, streaming=True),
+    collection_case(1000),
+    collection_case(5000),
+    collection_case(5000, workers=os.cpu_count() or 1),
+]
+
+
+def get_pattern(mode):
+    """Returns a deterministic pattern with smooth and noisy regions, so that
+    tiles compress like photographs rather than flat color."""
+    size = (PATTERN_SIZE, PATTERN_SIZE)
+    fractal = PIL.Image.effect_mandelbrot(size, (-2.2, -1.4, 0.8, 1.4), 64)
+    gradient = PIL.Image.linear_gradient("L").resize(size)
+    generator = random.Random(0)
+    noise = PIL.Image.frombytes(
+        "L", (256, 256), bytes(generator.getrandbits(8) for _ in range(256 * 256))
+    ).resize(size, PIL.Image.Resampling.NEAREST)
+    bands = [
+        PIL.Image.blend(fractal, noise, 0.25),
+        gradient,
+        PIL.Image.blend(gradient.rotate(90), noise, 0.5),
+        PIL.Image.blend(fractal.rotate(180), gradient, 0.5),
+    ]
+    if mode == "L":
+        return bands[0]
+    if mode == "RGB":
+        return PIL.Image.merge("RGB", bands[:3])
+    return PIL.Image.merge("RGBA", bands)
+
+
+def get_source(cache_path, megapixels, mode, source_format="tif"):
+    """Returns the path of a synthetic image, an uncompressed TIFF or a JPEG,
+    creating it if needed."""
+    path = os.path.join(
+        cache_path, "source-%smp-%s.%s" % (megapixels, mode, source_format)
+    )
+    if not os.path.exists(path):
+        width = int((megapixels * 1000000 * 4 / 3) ** 0.5)
+        height = int(megapixels * 1000000 / width)
+        image = get_pattern(mode).resize((width, height), PIL.Image.Resampling.BILINEAR)
+        if source_format == "jpg":
+            image.save(path + ".part", "JPEG", quality=90)
+        else:
+            image.save(path + ".part", "TIFF")
+        os.replace(path + ".part", path)
+    return path
+
+
+def get_collection_items(cache_path, count, tile_format):
+    """Returns the paths of synthetic Deep Zoom images, creating them if
+    needed."""
+    items_path = os.path.join(cache_path, "items-%s" % tile_format)
+    if not os.path.exists(items_path):
+        os.makedirs(items_path)
+    pattern = None
+    creator = deepzoom.ImageCreator(tile_format=tile_format)
+    items = []
+    for i in range(count):
+        path = os.path.join(items_path, "item%05d.dzi" % i)
+        if not os.path.exists(path):
+            if pattern is None:
+                pattern = get_pattern("RGB")
+            # Every item shows a different part of the pattern
+            x = (i * 37) % (PATTERN_SIZE - 160)
+            y = (i * 61) % (PATTERN_SIZE - 120)
+            image = pattern.crop((x, y, x + 160, y + 120)).resize(
+                COLLECTION_ITEM_SIZE, PIL.Image.Resampling.BILINEAR
+            )
+            creator.create(image, path)
+        items.append(path)
+    return items
+
+
+def get_bytes_written(path):
+    total = 0
+    for (directory, _, names) in os.walk(path):
+        for name in names:
+            total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+def count_tiles(path):
+    return sum(len(names) for (_, _, names) in os.walk(path))
+
+
+def get_peak_rss():
+    """Returns the peak resident memory of this process in bytes, or None."""
+    # On Linux, `ru_maxrss` carries over the peak of the parent process across
+    # `exec`, the high water mark of the process memory does not
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def run_case(case, cache_path):
+    """Runs a single case in this process. Returns its measurements."""
+    output_path = tempfile.mkdtemp(prefix="deepzoom-benchmark-")
+    try:
+        if case["kind"] == "image":
+            source = get_source(
+                cache_path,
+                case["megapixels"],
+                case["mode"],
+                case["source_format"],
+            )
+            creator = deepzoom.ImageCreator(
+                tile_size=case["tile_size"],
+                tile_format=case["tile_format"],
+                **case["options"]
+            )
+            destination = os.path.join(output_path, "image.dzi")
+            start = time.perf_counter()
+            creator.create(source, destination)
+            seconds = time.perf_counter() - start
+            tiles_path = os.path.join(output_path, "image_files")
+        else:
+            items = get_collection_items(
+                cache_path, case["items"], case["tile_format"]
+            )
+            creator = deepzoom.CollectionCreator(tile_format=case["tile_format"])
+            destination = os.path.join(output_path, "collection.dzc")
+            start = time.perf_counter()
+            creator.create(items, destination, workers=case["workers"])
+            seconds = time.perf_counter() - start
+            tiles_path = os.path.join(output_path, "collection_files")
+        tiles = count_tiles(tiles_path)
+        return {
+            "seconds": seconds,
+            "tiles": tiles,
+            "tiles_per_second": tiles / seconds,
+            "peak_rss_bytes": get_peak_rss(),
+            "bytes_written": get_bytes_written(output_path),
+        }
+    finally:
+        shutil.rmtree(output_path, ignore_errors=True)
+
+
+def run_case_process(case, cache_path):
+    """Runs a case in a fresh process, so that peak memory is its own."""
+    if case["kind"] == "image":
+        # Prepare inputs outside of the measured process
+        get_source(
+            cache_path,
+            case["megapixels"],
+            case["mode"],
+            case["source_format"],
+        )
+    else:
+        get_collection_items(cache_path, case["items"], case["tile_format"])
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-case", json.dumps(case)],
+        env=dict(os.environ, DEEPZOOM_BENCHMARK_CACHE=cache_path),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    return json.loads(process.stdout.decode("UTF-8"))
+
+
+def get_environment():
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of every case against a baseline. Returns the names of
+    the cases that got slower by more than `threshold`."""
+    previous = dict((result["name"], result) for result in baseline["results"])
+    regressions = []
+    print("\n%-48s %10s %10s %8s" % ("case", "baseline", "current", "change"))
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            print("%-48s %10s %9.3fs %8s" % (result["name"], "-", result["seconds"], "new"))
+            continue
+        change = result["seconds"] / old["seconds"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(result["name"])
+            flag = " slower"
+        elif change < -threshold:
+            flag = " faster"
+        print(
+            "%-48s %9.3fs %9.3fs %+7.1f%%%s"
+            % (result["name"], old["seconds"], result["seconds"], change * 100, flag)
+        )
+    return regressions
+
+
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [options]")
+
+    parser.add_option(
+        "-s",
+        "--suite",
+        dest="suite",
+        default="quick",
+        help="Suite of cases to run (%s). Default: quick" % ", ".join(sorted(SUITES)),
+    )
+    parser.add_option(
+        "-k",
+        "--filter",
+        dest="filter",
+        help="Only run cases whose name contains the given text.",
+    )
+    parser.add_option(
+        "-n",
+        "--repeat",
+        dest="repeat",
+        type="int",
+        default=3,
+        help="Number of runs of every case; the fastest is reported. Default: 3",
+    )
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output",
+        help="Write the results as JSON to the given file.",
+    )
+    parser.add_option(
+        "-b",
+        "--baseline",
+        dest="baseline",
+        help="Compare against the results in the given JSON file and exit with "
+        "status 1 if any case got slower.",
+    )
+    parser.add_option(
+        "-t",
+        "--threshold",
+        dest="threshold",
+        type="float",
+        default=0.1,
+        help="Relative slowdown that counts as a regression. Default: 0.1",
+    )
+    parser.add_option(
+        "-c",
+        "--cache",
+        dest="cache",
+        default=os.path.join(tempfile.gettempdir(), "deepzoom-benchmark"),
+        help="Directory for the synthetic inputs, which are reused across runs.",
+    )
+    parser.add_option("--run-case", dest="run_case", help=optparse.SUPPRESS_HELP)
+
+    (options, args) = parser.parse_args()
+
+    if options.run_case:
+        case = json.loads(options.run_case)
+        cache_path = os.environ["DEEPZOOM_BENCHMARK_CACHE"]
+        sys.stdout.write(json.dumps(run_case(case, cache_path)))
+        return
+
+    if options.suite not in SUITES:
+        parser.error("Unknown suite: %s" % options.suite)
+    cases = [
+        case
+        for case in SUITES[options.suite]
+        if not options.filter or options.filter in case["name"]
+    ]
+    if not os.path.exists(options.cache):
+        os.makedirs(options.cache)
+
+    results = []
+    for case in cases:
+        runs = [
+            run_case_process(case, options.cache)
+            for _ in range(max(options.repeat, 1))
+        ]
+        result = dict(case, **min(runs, key=lambda run: run["seconds"]))
+        result["peak_rss_bytes"] = max(run["peak_rss_bytes"] or 0 for run in runs)
+        results.append(result)
+        print(
+            "%-48s %8.3fs %10.0f tiles/s %8.1f MB peak %8.1f MB written"
+            % (
+                case["name"],
+                result["seconds"],
+                result["tiles_per_second"],
+                result["peak_rss_bytes"] / 1e6,
+                result["bytes_written"] / 1e6,
+            )
+        )
+
+    report = {"environment": get_environment(), "results": results}
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, options.threshold)
+        if regressions:
+            print("\n%d cases got slower" % len(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
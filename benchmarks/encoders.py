@@ -0,0 +1,157 @@
+"""Benchmark of the tile encoder presets.
+
+Encodes the same synthetic tiles with every preset of every tile format
+supported by Pillow and reports the encoding time and size per tile, relative
+to the default preset of the format:
+
+    python benchmarks/encoders.py --output encoders.json
+"""
+
+import json
+import os
+import sys
+import time
+
+import optparse
+
+import PIL.Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deepzoom._defaults import IMAGE_FORMATS
+from deepzoom._encoder import ENCODER_PRESETS, encode_tile, get_encoder_options
+
+from benchmark import get_pattern
+
+PRESETS = ("fast", "default", "small")
+
+
+def get_tiles(mode, tile_size, count):
+    """Returns tiles cut from a synthetic image at a photo-like scale."""
+    pattern = get_pattern(mode).resize((4096, 4096), PIL.Image.Resampling.BILINEAR)
+    tiles = []
+    step = (4096 - tile_size) // max(count - 1, 1)
+    for i in range(count):
+        x = (i * step) % (4096 - tile_size)
+        y = (i * step * 7) % (4096 - tile_size)
+        tiles.append(pattern.crop((x, y, x + tile_size, y + tile_size)))
+    return tiles
+
+
+def run(tile_format, preset, tiles, image_quality, repeat):
+    options = get_encoder_options(tile_format, preset)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = sum(
+            len(encode_tile(tile, tile_format, image_quality, options))
+            for tile in tiles
+        )
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return {
+        "format": tile_format,
+        "preset": preset,
+        "options": options,
+        "ms_per_tile": best / len(tiles) * 1000,
+        "bytes_per_tile": size / len(tiles),
+    }
+
+
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [options]")
+
+    parser.add_option(
+        "-m",
+        "--mode",
+        dest="mode",
+        default="RGB",
+        help="Image mode of the tiles (RGB, RGBA or L). Default: RGB",
+    )
+    parser.add_option(
+        "-s",
+        "--tile_size",
+        dest="tile_size",
+        type="int",
+        default=256,
+        help="Size of the tiles, including overlap. Default: 256",
+    )
+    parser.add_option(
+        "-n",
+        "--tiles",
+        dest="tiles",
+        type="int",
+        default=64,
+        help="Number of tiles encoded per preset. Default: 64",
+    )
+    parser.add_option(
+        "-q",
+        "--image_quality",
+        dest="image_quality",
+        type="float",
+        default=0.8,
+        help="Quality of the lossy formats (0-1). Default: 0.8",
+    )
+    parser.add_option(
+        "-r",
+        "--repeat",
+        dest="repeat",
+        type="int",
+        default=3,
+        help="Number of runs of every preset; the fastest is reported. Default: 3",
+    )
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output",
+        help="Write the results as JSON to the given file.",
+    )
+
+    (options, args) = parser.parse_args()
+
+    tiles = get_tiles(options.mode, options.tile_size, options.tiles)
+    results = []
+    print(
+        "%-6s %-8s %10s %12s %8s %8s"
+        % ("format", "preset", "ms/tile", "bytes/tile", "time", "size")
+    )
+    for tile_format in sorted(ENCODER_PRESETS):
+        if tile_format not in IMAGE_FORMATS:
+            continue
+        if tile_format == "jpg" and options.mode == "RGBA":
+            continue
+        default = run(
+            tile_format, "default", tiles, options.image_quality, options.repeat
+        )
+        for preset in PRESETS:
+            if preset == "default":
+                result = default
+            else:
+                result = run(
+                    tile_format, preset, tiles, options.image_quality, options.repeat
+                )
+            results.append(result)
+            print(
+                "%-6s %-8s %10.2f %12.0f %7.0f%% %7.0f%%"
+                % (
+                    tile_format,
+                    preset,
+                    result["ms_per_tile"],
+                    result["bytes_per_tile"],
+                    result["ms_per_tile"] / default["ms_per_tile"] * 100,
+                    result["bytes_per_tile"] / default["bytes_per_tile"] * 100,
+                )
+            )
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(
+                {"mode": options.mode, "tile_size": options.tile_size, "results": results},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Benchmark of cropping the tiles of a level.
+
+Crops every tile of synthetic levels of a few sizes, as `ImageCreator` does,
+and reports the time and the image buffers newly allocated per tile, next to
+the time of encoding them:
+
+    python benchmarks/tiling.py --encode jpg --output tiling.json
+"""
+
+import json
+import os
+import sys
+import time
+
+import optparse
+
+import PIL.Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from deepzoom._encoder import encode_tile, get_encoder_options
+from deepzoom._image_descriptor import DeepZoomImageDescriptor
+
+from benchmark import get_pattern
+
+SIZES = (2048, 4096, 8192)
+
+
+def get_level(mode, size):
+    """Returns a synthetic level image of the given width and height."""
+    return get_pattern(mode).resize((size, size), PIL.Image.Resampling.BILINEAR)
+
+
+def crop_tiles(level, grid, tile_format):
+    options = get_encoder_options(tile_format) if tile_format else None
+    for (column, row, bounds) in grid.iter_bounds():
+        tile = level.crop(bounds)
+        if tile_format:
+            encode_tile(tile, tile_format, 0.8, options)
+
+
+def run(level, grid, tile_format, repeat):
+    """Returns the fastest of `repeat` runs, in milliseconds per tile, and the
+    image buffers allocated per tile."""
+    best = None
+    for _ in range(repeat):
+        before = PIL.Image.core.get_stats()
+        start = time.perf_counter()
+        crop_tiles(level, grid, tile_format)
+        seconds = time.perf_counter() - start
+        after = PIL.Image.core.get_stats()
+        best = seconds if best is None else min(best, seconds)
+    allocations = after["allocated_blocks"] - before["allocated_blocks"]
+    return (best / len(grid) * 1000, allocations / len(grid))
+
+
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [options]")
+
+    parser.add_option(
+        "-m",
+        "--mode",
+        dest="mode",
+        default="RGB",
+        help="Image mode of the levels (RGB, RGBA or L). Default: RGB",
+    )
+    parser.add_option(
+        "-s",
+        "--tile_size",
+        dest="tile_size",
+        type="int",
+        default=254,
+        help="Size of the tiles, without overlap. Default: 254",
+    )
+    parser.add_option(
+        "-e",
+        "--encode",
+        dest="tile_format",
+        help="Also time encoding every tile in the given format (jpg, png, ...).",
+    )
+    parser.add_option(
+        "-r",
+        "--repeat",
+        dest="repeat",
+        type="int",
+        default=3,
+        help="Number of runs of every case; the fastest is reported. Default: 3",
+    )
+    parser.add_option(
+        "-o",
+        "--output",
+        dest="output",
+        help="Write the results as JSON to the given file.",
+    )
+
+    (options, args) = parser.parse_args()
+
+    if PIL.Image.core.get_blocks_max():
+        print("PILLOW_BLOCKS_MAX is set, Pillow reuses freed image buffers")
+    results = []
+    print(
+        "%6s %8s %10s %12s %12s"
+        % ("size", "tiles", "ms/tile", "allocs/tile", "encode ms")
+    )
+    for size in SIZES:
+        level = get_level(options.mode, size)
+        descriptor = DeepZoomImageDescriptor(
+            width=size, height=size, tile_size=options.tile_size, tile_overlap=1
+        )
+        grid = descriptor.tile_grid(descriptor.num_levels - 1)
+        crop_ms, allocations = run(level, grid, None, options.repeat)
+        result = {
+            "size": size,
+            "tiles": len(grid),
+            "ms_per_tile": crop_ms,
+            "allocations_per_tile": allocations,
+        }
+        if options.tile_format:
+            total_ms, _ = run(level, grid, options.tile_format, options.repeat)
+            result["encode_ms_per_tile"] = total_ms - crop_ms
+        results.append(result)
+        print(
+            "%6d %8d %10.3f %12.2f %12s"
+            % (
+                size,
+                len(grid),
+                crop_ms,
+                allocations,
+                "%.3f" % result["encode_ms_per_tile"]
+                if options.tile_format
+                else "-",
+            )
+        )
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(
+                {
+                    "mode": options.mode,
+                    "tile_size": options.tile_size,
+                    "tile_format": options.tile_format,
+                    "results": results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -32,11 +32,32 @@
 #  SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+from .aio import AsyncConverter, get_default_converter, set_default_converter
 from .collection import DeepZoomCollection
 from .creator import ImageCreator, CollectionCreator
+from .fetcher import DiskCache, Fetcher, get_default_fetcher, set_default_fetcher
+from .retile import retile
+from .stats import BuildStats
+from .tile_pack import TilePackReader, TilePackWriter, pack_tiles, unpack_tiles
+from .tile_source import DeepZoomTileSource, DeepZoomWSGIApplication
 
 __all__ = (
     "DeepZoomCollection",
     "ImageCreator",
-    "CollectionCreator"
+    "CollectionCreator",
+    "DeepZoomTileSource",
+    "DeepZoomWSGIApplication",
+    "BuildStats",
+    "TilePackReader",
+    "TilePackWriter",
+    "pack_tiles",
+    "unpack_tiles",
+    "retile",
+    "AsyncConverter",
+    "get_default_converter",
+    "set_default_converter",
+    "DiskCache",
+    "Fetcher",
+    "get_default_fetcher",
+    "set_default_fetcher",
 )
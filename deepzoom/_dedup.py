@@ -0,0 +1,56 @@
+import hashlib
+import os
+import shutil
+
+from ._cache import LRUCache
+
+# Distinct tiles remembered by a deduplicator. Duplicates are mostly uniform
+# tiles of margins and background, which stay among the most recent ones.
+MAX_TILES = 65536
+
+
+class TileDeduplicator(object):
+    """Finds tiles whose pixels are identical to a tile seen before, so that
+    every distinct tile is encoded once.
+
+    Tiles are keyed by their mode, size and raw pixel buffer: uniform tiles by
+    their single color, found by comparing the buffer with its first pixel
+    repeated, and other tiles by a SHA-1 hash of the buffer, which costs about
+    as much as encoding a JPEG tile. Keys map to whatever the caller records
+    about the first tile, such as its path. Only the `max_tiles` most recently
+    used keys are remembered.
+    """
+
+    def __init__(self, max_tiles=MAX_TILES):
+        self._originals = LRUCache(max_entries=max_tiles)
+
+    def get_key(self, tile):
+        data = tile.tobytes()
+        width, height = tile.size
+        pixel = data[: len(data) // max(width * height, 1)]
+        # Most tiles differ from their first pixel early on
+        if data.startswith(pixel * 64) and data == pixel * (width * height):
+            return (tile.mode, tile.size, pixel)
+        return (tile.mode, tile.size, hashlib.sha1(data).digest())
+
+    def get(self, key):
+        """Returns the record of the first tile with the given key, or None."""
+        return self._originals.get(key)
+
+    def add(self, key, original):
+        self._originals.put(key, original)
+
+
+def link_tile(original_path, tile_path):
+    """Makes `tile_path` a hard link to an identical tile, or a copy where hard
+    links are not supported. Like `write_tile`, the link is created under a
+    temporary name and then renamed. Tiles are always replaced rather than
+    written in place, so linked tiles can be updated independently."""
+    temp_path = tile_path + ".part"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(original_path, temp_path)
+    except OSError:
+        shutil.copyfile(original_path, temp_path)
+    os.replace(temp_path, tile_path)
@@ -1,10 +1,13 @@
 import PIL.Image
+import PIL.features
 
 NS_DEEPZOOM = "http://schemas.microsoft.com/deepzoom/2008"
 
 DEFAULT_RESIZE_FILTER = PIL.Image.Resampling.LANCZOS
 DEFAULT_IMAGE_FORMAT = "jpg"
 
+PACK_EXTENSION = ".dzp"
+
 RESIZE_FILTERS = {
     "cubic": PIL.Image.Resampling.BICUBIC,
     "bilinear": PIL.Image.Resampling.BILINEAR,
@@ -16,4 +19,11 @@ RESIZE_FILTERS = {
 IMAGE_FORMATS = {
     "jpg": "jpg",
     "png": "png",
-}
\ No newline at end of file
+}
+
+# Formats that depend on how Pillow was built
+if PIL.features.check_module("webp"):
+    IMAGE_FORMATS["webp"] = "webp"
+PIL.Image.init()
+if "AVIF" in PIL.Image.SAVE:
+    IMAGE_FORMATS["avif"] = "avif"
\ No newline at end of file
@@ -0,0 +1,96 @@
+import io
+import os
+import time
+
+import PIL.Image
+
+
+TILE_FORMATS = {
+    "jpg": "JPEG",
+    "png": "PNG",
+    "webp": "WEBP",
+    "avif": "AVIF",
+}
+
+# Formats taking `image_quality`
+LOSSY_FORMATS = ("jpg", "webp", "avif")
+
+# Pillow save options by tile format and preset, trading encoding speed for
+# size. The default presets keep the defaults of Pillow.
+ENCODER_PRESETS = {
+    "jpg": {
+        "fast": {},
+        "default": {},
+        "small": {"optimize": True, "progressive": True},
+    },
+    "png": {
+        "fast": {"compress_level": 1},
+        "default": {},
+        "small": {"optimize": True},
+    },
+    "webp": {
+        "fast": {"method": 0},
+        "default": {},
+        "small": {"method": 6},
+    },
+    "avif": {
+        "fast": {"speed": 10},
+        "default": {},
+        "small": {"speed": 2},
+    },
+}
+
+
+def get_encoder_options(tile_format, preset="default", options=None):
+    """Returns the save options of a preset, updated with the given options."""
+    presets = ENCODER_PRESETS.get(tile_format, {"default": {}})
+    if preset not in presets:
+        raise ValueError("Unknown encoder preset: %s" % preset)
+    encoder_options = dict(presets[preset])
+    encoder_options.update(options or {})
+    return encoder_options
+
+
+def save_tile(tile, file, tile_format, image_quality, encoder_options=None):
+    """Encodes a tile to a path or file object. Formats other than those of
+    `TILE_FORMATS`, such as of existing collections, are saved by extension."""
+    options = dict(encoder_options or {})
+    if tile_format in LOSSY_FORMATS:
+        options.setdefault("quality", int(image_quality * 100))
+    if tile_format in TILE_FORMATS:
+        image_format = TILE_FORMATS[tile_format]
+    else:
+        image_format = PIL.Image.registered_extensions().get("." + tile_format)
+        if image_format is None:
+            raise ValueError("Unknown tile format: %s" % tile_format)
+    tile.save(file, image_format, **options)
+
+
+def write_tile(tile, tile_path, tile_format, image_quality, encoder_options=None):
+    """Encodes a tile to a path. The file is written under a temporary name and
+    then renamed, so it is never left partially written.
+
+    Returns (encode seconds, write seconds, bytes written).
+    """
+    start = time.perf_counter()
+    data = encode_tile(tile, tile_format, image_quality, encoder_options)
+    encoded = time.perf_counter()
+    temp_path = tile_path + ".part"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, tile_path)
+    return (encoded - start, time.perf_counter() - encoded, len(data))
+
+
+def encode_tile(tile, tile_format, image_quality, encoder_options=None):
+    """Encodes a tile to bytes."""
+    file = io.BytesIO()
+    save_tile(tile, file, tile_format, image_quality, encoder_options)
+    return file.getvalue()
+
+
+def encode_tile_timed(tile, tile_format, image_quality, encoder_options=None):
+    """Encodes a tile to bytes. Returns (bytes, encode seconds)."""
+    start = time.perf_counter()
+    data = encode_tile(tile, tile_format, image_quality, encoder_options)
+    return (data, time.perf_counter() - start)
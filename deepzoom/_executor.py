@@ -0,0 +1,73 @@
+from collections import deque
+import concurrent.futures
+
+
+class BoundedExecutor(object):
+    """Runs tasks on a pool of threads or processes while capping the number of
+    tasks in flight. With a single worker, tasks run inline in submission order.
+    """
+
+    def __init__(self, workers=1, processes=False, max_in_flight=None):
+        self.workers = max(int(workers), 1)
+        self.processes = processes
+        self.max_in_flight = max_in_flight or self.workers * 4
+        self._futures = deque()
+        self._pool = None
+        if self.workers > 1:
+            if processes:
+                self._pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+            else:
+                self._pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+
+    def submit(self, fn, *args, callback=None):
+        """Schedules `fn(*args)`, blocking while too many tasks are in flight.
+
+        `callback` is called with the result on the submitting thread, in
+        submission order.
+        """
+        if self._pool is None:
+            result = fn(*args)
+            if callback is not None:
+                callback(result)
+            return
+        while len(self._futures) >= self.max_in_flight:
+            self._collect()
+        self._futures.append((self._pool.submit(fn, *args), callback))
+
+    def after(self, callback):
+        """Calls `callback(None)` on the submitting thread once all tasks
+        submitted so far are done."""
+        if self._pool is None:
+            callback(None)
+            return
+        self._futures.append((None, callback))
+
+    def wait(self):
+        """Blocks until all submitted tasks are done. Re-raises task errors."""
+        while len(self._futures) > 0:
+            self._collect()
+
+    def _collect(self):
+        future, callback = self._futures.popleft()
+        result = future.result() if future is not None else None
+        if callback is not None:
+            callback(result)
+
+    def shutdown(self):
+        for (future, _) in self._futures:
+            if future is not None:
+                future.cancel()
+        self._futures.clear()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.wait()
+        finally:
+            self.shutdown()
@@ -1,49 +1,128 @@
+from array import array
+import io
 import math
-import xml.dom.minidom
 
 from ._utils import safe_open, remove
-from ._defaults import NS_DEEPZOOM
+from ._defaults import NS_DEEPZOOM, PACK_EXTENSION
+from ._xml import XMLWriter, iterparse
 
 class DeepZoomImageDescriptor(object):
+    __slots__ = (
+        "_width",
+        "_height",
+        "_tile_size",
+        "_tile_overlap",
+        "tile_format",
+        "_num_levels",
+        "_dimensions",
+        "_num_tiles",
+        "_tile_grids",
+    )
+
     def __init__(
         self, width=None, height=None, tile_size=254, tile_overlap=1, tile_format="jpg"
     ):
-        self.width = width
-        self.height = height
-        self.tile_size = tile_size
-        self.tile_overlap = tile_overlap
+        self._width = width
+        self._height = height
+        self._tile_size = tile_size
+        self._tile_overlap = tile_overlap
         self.tile_format = tile_format
+        self._reset_geometry()
+
+    def _reset_geometry(self):
+        # Per-level geometry, computed on first use
         self._num_levels = None
+        self._dimensions = None
+        self._num_tiles = None
+        self._tile_grids = None
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, value):
+        self._width = value
+        self._reset_geometry()
+
+    @property
+    def height(self):
+        return self._height
+
+    @height.setter
+    def height(self, value):
+        self._height = value
+        self._reset_geometry()
+
+    @property
+    def tile_size(self):
+        return self._tile_size
+
+    @tile_size.setter
+    def tile_size(self, value):
+        self._tile_size = value
+        self._reset_geometry()
+
+    @property
+    def tile_overlap(self):
+        return self._tile_overlap
+
+    @tile_overlap.setter
+    def tile_overlap(self, value):
+        self._tile_overlap = value
+        self._reset_geometry()
 
     def open(self, source):
-        """Intialize descriptor from an existing descriptor file."""
-        doc = xml.dom.minidom.parse(safe_open(source))
-        image = doc.getElementsByTagName("Image")[0]
-        size = doc.getElementsByTagName("Size")[0]
-        self.width = int(size.getAttribute("Width"))
-        self.height = int(size.getAttribute("Height"))
-        self.tile_size = int(image.getAttribute("TileSize"))
-        self.tile_overlap = int(image.getAttribute("Overlap"))
-        self.tile_format = image.getAttribute("Format")
+        """Intialize descriptor from an existing descriptor file or tile pack."""
+        if source.endswith(PACK_EXTENSION):
+            # Imported here because tile packs are built on descriptors
+            from .tile_pack import TilePackReader
+
+            with TilePackReader(source) as reader:
+                self.read(io.BytesIO(reader.get_descriptor()))
+        else:
+            self.read(safe_open(source))
+
+    def read(self, file):
+        """Intialize descriptor from a descriptor file object."""
+        for (event, name, element) in iterparse(file, ("Image", "Size")):
+            if event != "start":
+                continue
+            if name == "Image":
+                self.tile_size = int(element.get("TileSize"))
+                self.tile_overlap = int(element.get("Overlap"))
+                self.tile_format = element.get("Format")
+            else:
+                self.width = int(element.get("Width"))
+                self.height = int(element.get("Height"))
 
     def save(self, destination):
         """Save descriptor file."""
         file = open(destination, "wb")
-        doc = xml.dom.minidom.Document()
-        image = doc.createElementNS(NS_DEEPZOOM, "Image")
-        image.setAttribute("xmlns", NS_DEEPZOOM)
-        image.setAttribute("TileSize", str(self.tile_size))
-        image.setAttribute("Overlap", str(self.tile_overlap))
-        image.setAttribute("Format", str(self.tile_format))
-        size = doc.createElementNS(NS_DEEPZOOM, "Size")
-        size.setAttribute("Width", str(self.width))
-        size.setAttribute("Height", str(self.height))
-        image.appendChild(size)
-        doc.appendChild(image)
-        descriptor = doc.toxml(encoding="UTF-8")
-        file.write(descriptor)
+        self.write(file)
         file.close()
 
+    def to_xml(self):
+        """Descriptor as UTF-8 encoded XML."""
+        file = io.BytesIO()
+        self.write(file)
+        return file.getvalue()
+
+    def write(self, file):
+        """Write descriptor to a binary file object."""
+        writer = XMLWriter(file)
+        writer.start(
+            "Image",
+            (
+                ("xmlns", NS_DEEPZOOM),
+                ("TileSize", self.tile_size),
+                ("Overlap", self.tile_overlap),
+                ("Format", self.tile_format),
+            ),
+        )
+        writer.element("Size", (("Width", self.width), ("Height", self.height)))
+        writer.end("Image")
+
     @classmethod
     def remove(self, filename):
         """Remove descriptor file (DZI) and tiles folder."""
@@ -57,6 +136,21 @@ class DeepZoomImageDescriptor(object):
             self._num_levels = int(math.ceil(math.log(max_dimension, 2))) + 1
         return self._num_levels
 
+    def _compute_geometry(self):
+        max_level = self.num_levels - 1
+        self._dimensions = []
+        self._num_tiles = []
+        for level in range(self.num_levels):
+            # Same as ceil(size * 0.5 ** (max_level - level)), in integers
+            shift = max_level - level
+            width = (self.width + (1 << shift) - 1) >> shift
+            height = (self.height + (1 << shift) - 1) >> shift
+            self._dimensions.append((width, height))
+            self._num_tiles.append(
+                (-(-width // self.tile_size), -(-height // self.tile_size))
+            )
+        self._tile_grids = [None] * self.num_levels
+
     def get_scale(self, level):
         """Scale of a pyramid level."""
         assert 0 <= level and level < self.num_levels, "Invalid pyramid level"
@@ -66,30 +160,98 @@ class DeepZoomImageDescriptor(object):
     def get_dimensions(self, level):
         """Dimensions of level (width, height)"""
         assert 0 <= level and level < self.num_levels, "Invalid pyramid level"
-        scale = self.get_scale(level)
-        width = int(math.ceil(self.width * scale))
-        height = int(math.ceil(self.height * scale))
-        return (width, height)
+        if self._dimensions is None:
+            self._compute_geometry()
+        return self._dimensions[level]
 
     def get_num_tiles(self, level):
         """Number of tiles (columns, rows)"""
         assert 0 <= level and level < self.num_levels, "Invalid pyramid level"
-        w, h = self.get_dimensions(level)
+        if self._num_tiles is None:
+            self._compute_geometry()
+        return self._num_tiles[level]
+
+    def tile_grid(self, level):
+        """Bounds of all tiles in the given level, as a `DeepZoomTileGrid`."""
+        assert 0 <= level and level < self.num_levels, "Invalid pyramid level"
+        if self._tile_grids is None:
+            self._compute_geometry()
+        grid = self._tile_grids[level]
+        if grid is None:
+            grid = DeepZoomTileGrid(
+                level,
+                self._dimensions[level],
+                self._num_tiles[level],
+                self.tile_size,
+                self.tile_overlap,
+            )
+            self._tile_grids[level] = grid
+        return grid
+
+    def get_tile_bounds(self, level, column, row):
+        """Bounding box of the tile (x1, y1, x2, y2)"""
+        return self.tile_grid(level).get_bounds(column, row)
+
+    def tiles_in_rect(self, level, x1, y1, x2, y2):
+        """Tiles of the given level covering the rectangle (x1, y1, x2, y2) in
+        level pixels. Returns (columns, rows) as ranges, which are empty if the
+        rectangle lies outside of the level."""
+        columns, rows = self.get_num_tiles(level)
+        tile_size = self.tile_size
         return (
-            int(math.ceil(float(w) / self.tile_size)),
-            int(math.ceil(float(h) / self.tile_size)),
+            range(max(x1 // tile_size, 0), min(-(-x2 // tile_size), columns)),
+            range(max(y1 // tile_size, 0), min(-(-y2 // tile_size), rows)),
         )
 
-    def get_tile_bounds(self, level, column, row):
+
+class DeepZoomTileGrid(object):
+    """Bounds of all tiles in a pyramid level.
+
+    Tile bounds are separable: the horizontal bounds only depend on the column
+    and the vertical bounds on the row. They are stored as one array per edge,
+    so a grid takes memory proportional to columns plus rows.
+    """
+
+    __slots__ = ("level", "columns", "rows", "x1", "x2", "y1", "y2")
+
+    def __init__(self, level, dimensions, num_tiles, tile_size, tile_overlap):
+        self.level = level
+        self.columns, self.rows = num_tiles
+        self.x1, self.x2 = self._get_edges(
+            dimensions[0], self.columns, tile_size, tile_overlap
+        )
+        self.y1, self.y2 = self._get_edges(
+            dimensions[1], self.rows, tile_size, tile_overlap
+        )
+
+    @staticmethod
+    def _get_edges(size, count, tile_size, tile_overlap):
+        starts = array("l")
+        ends = array("l")
+        for i in range(count):
+            # Every tile but the first extends by the overlap on both sides
+            starts.append(i * tile_size - (tile_overlap if i else 0))
+            ends.append(min((i + 1) * tile_size + tile_overlap, size))
+        return (starts, ends)
+
+    def __len__(self):
+        return self.columns * self.rows
+
+    def __iter__(self):
+        """Iterator for all tiles, column by column. Returns (column, row)."""
+        for column in range(self.columns):
+            for row in range(self.rows):
+                yield (column, row)
+
+    def get_bounds(self, column, row):
         """Bounding box of the tile (x1, y1, x2, y2)"""
-        assert 0 <= level and level < self.num_levels, "Invalid pyramid level"
-        offset_x = 0 if column == 0 else self.tile_overlap
-        offset_y = 0 if row == 0 else self.tile_overlap
-        x = (column * self.tile_size) - offset_x
-        y = (row * self.tile_size) - offset_y
-        level_width, level_height = self.get_dimensions(level)
-        w = self.tile_size + (1 if column == 0 else 2) * self.tile_overlap
-        h = self.tile_size + (1 if row == 0 else 2) * self.tile_overlap
-        w = min(w, level_width - x)
-        h = min(h, level_height - y)
-        return (x, y, x + w, y + h)
\ No newline at end of file
+        return (self.x1[column], self.y1[row], self.x2[column], self.y2[row])
+
+    def iter_bounds(self):
+        """Iterator for all tiles, column by column. Returns (column, row, bounds)."""
+        x1, x2, y1, y2 = self.x1, self.x2, self.y1, self.y2
+        rows = range(self.rows)
+        for column in range(self.columns):
+            left, right = x1[column], x2[column]
+            for row in rows:
+                yield (column, row, (left, y1[row], right, y2[row]))
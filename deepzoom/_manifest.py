@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+# Rows hashed at a time when fingerprinting in-memory images
+FINGERPRINT_ROWS = 256
+
+
+def fingerprint_file(file):
+    """Returns a hex digest of the contents of a path or file object."""
+    digest = hashlib.sha1()
+    if isinstance(file, str):
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    else:
+        digest.update(file.getbuffer())
+    return digest.hexdigest()
+
+
+def fingerprint_image(image):
+    """Returns a hex digest of the mode, size and pixels of an image."""
+    digest = hashlib.sha1()
+    width, height = image.size
+    digest.update(("%s %s %s\n" % (image.mode, width, height)).encode("UTF-8"))
+    for y in range(0, height, FINGERPRINT_ROWS):
+        rows = image.crop((0, y, width, min(y + FINGERPRINT_ROWS, height)))
+        digest.update(rows.tobytes())
+    return digest.hexdigest()
+
+
+class BuildManifest(object):
+    """Records the source fingerprint, settings and completed levels of a Deep
+    Zoom image build, so that an interrupted build can be resumed and an
+    unchanged one skipped."""
+
+    def __init__(self, source=None, settings=None, levels=(), complete=False):
+        self.source = source
+        self.settings = settings or {}
+        self.levels = set(levels)
+        self.complete = complete
+
+    @classmethod
+    def open(cls, filename):
+        """Returns the manifest stored in a file, or None if there is none."""
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(
+            source=data["source"],
+            settings=data["settings"],
+            levels=data["levels"],
+            complete=data["complete"],
+        )
+
+    def save(self, filename):
+        """Writes the manifest, atomically replacing an existing one."""
+        data = {
+            "version": MANIFEST_VERSION,
+            "source": self.source,
+            "settings": self.settings,
+            "levels": sorted(self.levels),
+            "complete": self.complete,
+        }
+        temp_path = filename + ".part"
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(temp_path, filename)
+
+    def matches(self, other):
+        """Whether both builds have the same source and settings."""
+        return self.source == other.source and self.settings == other.settings
+
+
+class ShardManifest(object):
+    """Records the part of a sharded Deep Zoom image build that a shard wrote:
+    the range of tile rows of every level down to the merge level, and the
+    file holding its rows of the merge level, from which the merge step builds
+    the levels below."""
+
+    def __init__(
+        self,
+        shard,
+        shards,
+        size,
+        settings,
+        merge_level,
+        rows=None,
+        raster=None,
+        complete=False,
+    ):
+        self.shard = shard
+        self.shards = shards
+        self.size = tuple(size)
+        self.settings = settings
+        self.merge_level = merge_level
+        # Level to (first row, last row + 1)
+        self.rows = rows or {}
+        self.raster = raster
+        self.complete = complete
+
+    @classmethod
+    def open(cls, filename):
+        """Returns the manifest stored in a file, or None if there is none."""
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(
+            shard=data["shard"],
+            shards=data["shards"],
+            size=data["size"],
+            settings=data["settings"],
+            merge_level=data["merge_level"],
+            rows=dict(
+                (int(level), tuple(rows)) for (level, rows) in data["rows"].items()
+            ),
+            raster=data["raster"],
+            complete=data["complete"],
+        )
+
+    def save(self, filename):
+        """Writes the manifest, atomically replacing an existing one."""
+        data = {
+            "version": MANIFEST_VERSION,
+            "shard": self.shard,
+            "shards": self.shards,
+            "size": list(self.size),
+            "settings": self.settings,
+            "merge_level": self.merge_level,
+            "rows": dict(
+                (str(level), list(rows)) for (level, rows) in self.rows.items()
+            ),
+            "raster": self.raster,
+            "complete": self.complete,
+        }
+        temp_path = filename + ".part"
+        with open(temp_path, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(temp_path, filename)
+
+    def matches(self, other):
+        """Whether both shards belong to the same build."""
+        return (
+            self.shards == other.shards
+            and self.size == other.size
+            and self.settings == other.settings
+            and self.merge_level == other.merge_level
+        )
@@ -0,0 +1,47 @@
+"""Table-driven Z-order (Morton number) encoding and decoding."""
+
+from array import array
+
+# Bits of every byte spread out to the even bits of a 16-bit number
+SPREAD = tuple(sum(((b >> i) & 1) << (2 * i) for i in range(8)) for b in range(256))
+
+# Even and odd bits of every byte compacted into a nibble
+COMPACT_EVEN = tuple(sum(((b >> (2 * i)) & 1) << i for i in range(4)) for b in range(256))
+COMPACT_ODD = tuple(COMPACT_EVEN[b >> 1] for b in range(256))
+
+
+def encode(column, row):
+    """Returns the Z-order (Morton number) of the lower 32 bits of a position."""
+    z_order = 0
+    for shift in (0, 8, 16, 24):
+        z_order |= (
+            SPREAD[(column >> shift) & 0xFF] | SPREAD[(row >> shift) & 0xFF] << 1
+        ) << (2 * shift)
+    return z_order
+
+
+def decode(z_order):
+    """Returns the position (column, row) from the lower 32 bits of a Z-order."""
+    column = 0
+    row = 0
+    for shift in (0, 8, 16, 24):
+        b = (z_order >> shift) & 0xFF
+        column |= COMPACT_EVEN[b] << (shift // 2)
+        row |= COMPACT_ODD[b] << (shift // 2)
+    return column, row
+
+
+def decode_many(z_orders):
+    """Returns the positions of many Z-orders as arrays (columns, rows)."""
+    even = COMPACT_EVEN
+    odd = COMPACT_ODD
+    columns = array("L")
+    rows = array("L")
+    for z_order in z_orders:
+        b0 = z_order & 0xFF
+        b1 = (z_order >> 8) & 0xFF
+        b2 = (z_order >> 16) & 0xFF
+        b3 = (z_order >> 24) & 0xFF
+        columns.append(even[b0] | even[b1] << 4 | even[b2] << 8 | even[b3] << 12)
+        rows.append(odd[b0] | odd[b1] << 4 | odd[b2] << 8 | odd[b3] << 12)
+    return columns, rows
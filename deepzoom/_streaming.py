@@ -0,0 +1,183 @@
+import math
+
+import PIL.Image
+
+# Number of extra rows on either side of a strip needed by the widest resize
+# filter (LANCZOS, support of 3 destination pixels) when halving a level.
+FILTER_MARGIN = 8
+
+
+def iter_strips(image, strip_height):
+    """Iterator for horizontal strips of an image. Returns (y, strip).
+
+    Sources stored as uncompressed rows (PPM/PGM, BMP, uncompressed TIFF) are
+    decoded one strip at a time straight from the file. Any other source is
+    decoded once in full and then sliced into strips.
+    """
+    width, height = image.size
+    bands = _get_raw_bands(image)
+    if bands is None:
+        image.load()
+    for y in range(0, height, strip_height):
+        y2 = min(y + strip_height, height)
+        if bands is None:
+            yield (y, image.crop((0, y, width, y2)))
+        else:
+            yield (y, _read_rows(image, bands, y, y2))
+
+
+def read_region(image, box):
+    """Returns the region (x1, y1, x2, y2) of an image. Like `iter_strips`, only
+    reads the rows of the region from sources stored as uncompressed rows, and
+    decodes any other source in full."""
+    bands = _get_raw_bands(image)
+    if bands is None:
+        return image.crop(box)
+    x1, y1, x2, y2 = box
+    rows = _read_rows(image, bands, y1, y2)
+    if x1 == 0 and x2 == image.size[0]:
+        return rows
+    return rows.crop((x1, 0, x2, y2 - y1))
+
+
+def _get_raw_bands(image):
+    if not getattr(image, "tile", None) or getattr(image, "fp", None) is None:
+        return None
+    if hasattr(image, "load_read") or hasattr(image, "load_seek"):
+        return None
+    if image.mode not in ("1", "L", "LA", "I", "F", "RGB", "RGBA", "RGBX", "CMYK"):
+        return None
+    width = image.size[0]
+    bands = []
+    for (decoder_name, extents, offset, args) in image.tile:
+        x0, y0, x1, y1 = extents
+        if decoder_name != "raw" or x0 != 0 or x1 != width:
+            return None
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        if orientation not in (1, -1):
+            return None
+        if not stride:
+            try:
+                line = PIL.Image.new(image.mode, (width, 1)).tobytes("raw", rawmode)
+            except (ValueError, OSError):
+                return None
+            stride = len(line)
+        bands.append((y0, y1, offset, rawmode, stride, orientation))
+    return sorted(bands)
+
+
+def _read_rows(image, bands, y1, y2):
+    width = image.size[0]
+    strip = None
+    for (band_y1, band_y2, offset, rawmode, stride, orientation) in bands:
+        top = max(y1, band_y1)
+        bottom = min(y2, band_y2)
+        if top >= bottom:
+            continue
+        if orientation == 1:
+            image.fp.seek(offset + (top - band_y1) * stride)
+        else:
+            image.fp.seek(offset + (band_y2 - bottom) * stride)
+        data = image.fp.read((bottom - top) * stride)
+        rows = PIL.Image.frombytes(
+            image.mode, (width, bottom - top), data, "raw", rawmode, stride, orientation
+        )
+        if top == y1 and bottom == y2:
+            return rows
+        if strip is None:
+            strip = PIL.Image.new(image.mode, (width, y2 - y1))
+        strip.paste(rows, (0, top - y1))
+    return strip
+
+
+class LevelStream(object):
+    """Holds a sliding window of rows of one pyramid level.
+
+    Rows are fed from the top down. As soon as all rows of a row of tiles are
+    available, `emit(level, image, rows, y)` is called with the window image, the
+    tile rows it completes and the window offset. Rows of the level below are
+    produced by halving the window and fed into `next`, after which rows that
+    are no longer needed are dropped.
+    """
+
+    def __init__(self, descriptor, level, resize_filter, emit, next=None):
+        self.descriptor = descriptor
+        self.level = level
+        self.resize_filter = resize_filter
+        self.emit = emit
+        self.next = next
+        self.width, self.height = descriptor.get_dimensions(level)
+        self.num_rows = descriptor.get_num_tiles(level)[1]
+        self.grid = descriptor.tile_grid(level)
+        self.window = None
+        self.window_y = 0
+        self.next_row = 0
+        self.next_y = 0
+        if next is not None:
+            self.scale = float(self.height) / next.height
+
+    @property
+    def window_end(self):
+        return self.window_y + (self.window.size[1] if self.window else 0)
+
+    def feed(self, rows):
+        """Appends the next rows of the level."""
+        if self.window is None:
+            self.window = rows
+        else:
+            width, height = self.window.size
+            window = PIL.Image.new(self.window.mode, (width, height + rows.size[1]))
+            window.paste(self.window, (0, 0))
+            window.paste(rows, (0, height))
+            self.window = window
+        self._flush()
+
+    def _flush(self):
+        end = self.window_end
+        # Rows of tiles
+        ready = []
+        while self.next_row < self.num_rows:
+            if self.grid.y2[self.next_row] > end:
+                break
+            ready.append(self.next_row)
+            self.next_row += 1
+        if ready:
+            self.emit(self.level, self.window, ready, self.window_y)
+        # Rows of the level below
+        keep = self.height
+        if self.next_row < self.num_rows:
+            keep = self.grid.y1[self.next_row]
+        if self.next is not None:
+            y = self.next_y
+            while y < self.next.height:
+                needed = min(int(math.ceil((y + 1) * self.scale)) + FILTER_MARGIN, self.height)
+                if needed > end:
+                    break
+                y += 1
+            if y > self.next_y:
+                box = (
+                    0,
+                    self.next_y * self.scale - self.window_y,
+                    self.width,
+                    min(y * self.scale, self.height) - self.window_y,
+                )
+                rows = self.window.resize(
+                    (self.next.width, y - self.next_y), self.resize_filter, box=box
+                )
+                self.next_y = y
+                self.next.feed(rows)
+            if self.next_y < self.next.height:
+                start = int(math.floor(self.next_y * self.scale)) - FILTER_MARGIN
+                keep = min(keep, max(start, 0))
+        # Drop rows that are no longer needed
+        if keep > self.window_y:
+            if keep >= end:
+                self.window = None
+                self.window_y = end
+            else:
+                self.window = self.window.crop(
+                    (0, keep - self.window_y, self.width, end - self.window_y)
+                )
+                self.window_y = keep
@@ -4,9 +4,13 @@ import urllib.request
 import io
 import os
 
+from ._defaults import PACK_EXTENSION
+from .fetcher import get_default_fetcher
+
 def get_or_create_path(path):
     if not os.path.exists(path):
-        os.makedirs(path)
+        # Workers may create the same path concurrently
+        os.makedirs(path, exist_ok=True)
     return path
 
 
@@ -22,9 +26,29 @@ def get_files_path(path):
     return os.path.splitext(path)[0] + "_files"
 
 
+def get_pack_path(path):
+    return os.path.splitext(path)[0] + PACK_EXTENSION
+
+
+def get_manifest_path(path):
+    return os.path.splitext(path)[0] + ".manifest.json"
+
+
+def get_shards_path(path):
+    return os.path.splitext(path)[0] + "_shards"
+
+
 def remove(path):
     os.remove(path)
+    manifest_path = get_manifest_path(path)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
     tiles_path = get_files_path(path)
+    pack_path = get_pack_path(path)
+    if os.path.exists(pack_path):
+        os.remove(pack_path)
+        if not os.path.exists(tiles_path):
+            return
     shutil.rmtree(tiles_path)
 
 
@@ -35,4 +59,18 @@ def safe_open(path):
     # XML to still have the original input paths instead of absolute paths:
     has_scheme = bool(urlparse(path).scheme)
     normalized_path = ("file:%s" % urllib.request.pathname2url(os.path.abspath(path))) if not has_scheme else path
-    return io.BytesIO(urllib.request.urlopen(normalized_path).read())
\ No newline at end of file
+    if is_remote(normalized_path):
+        return io.BytesIO(get_default_fetcher().fetch(normalized_path))
+    return io.BytesIO(urllib.request.urlopen(normalized_path).read())
+
+
+def is_remote(path):
+    """Whether a path is an HTTP(S) URL."""
+    return urlparse(path).scheme in ("http", "https")
+
+
+def open_stream(path):
+    """Opens a local path for reading, or fetches a URL into memory."""
+    if os.path.exists(path):
+        return open(path, "rb")
+    return safe_open(path)
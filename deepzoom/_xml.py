@@ -0,0 +1,83 @@
+"""Incremental XML reading and writing for Deep Zoom descriptors."""
+
+import xml.etree.ElementTree
+
+
+def get_local_name(tag):
+    """Returns the tag name without its namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def iterparse(file, tags):
+    """Iterator for the elements with one of the given local names, parsed
+    incrementally. Returns (event, name, element) for "start" and "end" events.
+
+    After its "end" event, an element is removed from its parent, so memory use
+    does not grow with the number of elements read.
+    """
+    parents = []
+    for (event, element) in xml.etree.ElementTree.iterparse(
+        file, events=("start", "end")
+    ):
+        name = get_local_name(element.tag)
+        if event == "start":
+            parents.append(element)
+            if name in tags:
+                yield (event, name, element)
+        else:
+            parents.pop()
+            if name in tags:
+                yield (event, name, element)
+                if parents:
+                    parents[-1].remove(element)
+
+
+def escape_attribute(value):
+    # Same escaping as `xml.dom.minidom`
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace('"', "&quot;")
+        .replace(">", "&gt;")
+    )
+
+
+class XMLWriter(object):
+    """Writes UTF-8 encoded XML to a binary file one element at a time. The
+    output is the same as `xml.dom.minidom` `toxml` or, when pretty printing,
+    `toprettyxml`."""
+
+    def __init__(self, file, pretty_print=False):
+        self.file = file
+        self.pretty_print = pretty_print
+        self.depth = 0
+        self.file.write(b'<?xml version="1.0" encoding="UTF-8"?>' + self._newline())
+
+    def _newline(self):
+        return b"\n" if self.pretty_print else b""
+
+    def _indent(self):
+        return b"\t" * self.depth if self.pretty_print else b""
+
+    def _tag(self, name, attributes, empty):
+        text = "<" + name
+        for (key, value) in attributes:
+            text += ' %s="%s"' % (key, escape_attribute(str(value)))
+        text += "/>" if empty else ">"
+        return self._indent() + text.encode("UTF-8") + self._newline()
+
+    def start(self, name, attributes=()):
+        """Writes the start tag of an element with children."""
+        self.file.write(self._tag(name, attributes, False))
+        self.depth += 1
+
+    def end(self, name):
+        """Writes the end tag of an element with children."""
+        self.depth -= 1
+        self.file.write(
+            self._indent() + ("</%s>" % name).encode("UTF-8") + self._newline()
+        )
+
+    def element(self, name, attributes=()):
+        """Writes an element without children."""
+        self.file.write(self._tag(name, attributes, True))
@@ -0,0 +1,178 @@
+import asyncio
+import concurrent.futures
+import copy
+import functools
+import os
+import shutil
+import threading
+import weakref
+
+from ._utils import get_files_path, get_manifest_path, get_pack_path
+
+
+__all__ = (
+    "AsyncConverter",
+    "get_default_converter",
+    "set_default_converter",
+)
+
+MAX_CONVERSIONS = 4
+
+
+class _Cancelled(Exception):
+    """Stops a cancelled conversion from within its thread."""
+
+
+class AsyncConverter(object):
+    """Runs Deep Zoom conversions for asyncio code without blocking the event
+    loop.
+
+    Every conversion runs on `executor`, by default a thread pool of its own
+    with `max_conversions` threads, which does all decoding, resizing and
+    encoding and all file and network I/O. Tiles can still be encoded by the
+    creator's own thread or process pool (see `ImageCreator` `workers`). The
+    executor must run conversions in threads, as it reports progress and
+    cancellation through shared memory.
+
+    At most `max_conversions` conversions run at once per event loop, others
+    wait for their turn. Every conversion runs on a copy of its creator, so
+    one creator can run any number of conversions at once. `progress`
+    callbacks are called on the event loop. Cancelling the task awaiting a
+    conversion stops it at its next tile, waits for its workers and removes
+    its partial output, except that of resumable builds, which can be resumed
+    later. The Deep Zoom images that a collection
+    created from raw images already finished are kept.
+    """
+
+    def __init__(self, max_conversions=MAX_CONVERSIONS, executor=None):
+        self.max_conversions = max(int(max_conversions), 1)
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._executor_lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    async def create_image(
+        self, creator, source, destination, progress=None, stats=None
+    ):
+        """Awaitable `ImageCreator.create`."""
+        # Creators keep the state of their build, so every build gets its own
+        creator = copy.copy(creator)
+        create = functools.partial(creator.create, source, destination, stats=stats)
+        await self._run(create, destination, progress, creator.resumable)
+
+    async def create_collection(
+        self, creator, images, destination, workers=1, progress=None, stats=None
+    ):
+        """Awaitable `CollectionCreator.create`."""
+        creator = copy.copy(creator)
+        create = functools.partial(
+            creator.create, list(images), destination, workers=workers, stats=stats
+        )
+        await self._run(create, destination, progress)
+
+    async def _run(self, create, destination, progress, resumable=False):
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+
+        def report(*args):
+            if cancelled.is_set():
+                raise _Cancelled()
+            if progress is not None:
+                loop.call_soon_threadsafe(progress, *args)
+
+        def run():
+            # May have been cancelled while waiting for a thread
+            if cancelled.is_set():
+                raise _Cancelled()
+            create(progress=report)
+
+        async with self._get_semaphore():
+            future = loop.run_in_executor(self._get_executor(), run)
+            try:
+                await asyncio.shield(future)
+            except asyncio.CancelledError:
+                cancelled.set()
+                # Output can only be removed once nothing writes it anymore
+                await _wait(future)
+                if not resumable:
+                    await _wait(
+                        loop.run_in_executor(
+                            self._get_executor(), _remove_output, destination
+                        )
+                    )
+                raise
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_conversions)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_conversions, thread_name_prefix="deepzoom"
+                )
+            return self._executor
+
+    def close(self):
+        """Shuts down the thread pool of the converter, unless it was given an
+        executor."""
+        with self._executor_lock:
+            if self._owns_executor and self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+async def _wait(future):
+    """Waits for a future to be done, even if cancelled again, ignoring its
+    result."""
+    while not future.done():
+        try:
+            await asyncio.shield(future)
+        except (asyncio.CancelledError, Exception):
+            pass
+
+
+def _remove_output(destination):
+    """Removes the descriptor, tiles folder or pack and build manifest of a
+    Deep Zoom image or collection, and their unfinished files."""
+    pack_path = get_pack_path(destination)
+    for path in (
+        destination,
+        destination + ".part",
+        pack_path,
+        pack_path + ".part",
+        get_manifest_path(destination),
+    ):
+        if os.path.exists(path):
+            os.remove(path)
+    tiles_path = get_files_path(destination)
+    if os.path.isdir(tiles_path):
+        shutil.rmtree(tiles_path)
+
+
+_default_converter = None
+_default_converter_lock = threading.Lock()
+
+
+def get_default_converter():
+    """Returns the converter used by `ImageCreator.create_async` and
+    `CollectionCreator.create_async`."""
+    global _default_converter
+    with _default_converter_lock:
+        if _default_converter is None:
+            _default_converter = AsyncConverter()
+        return _default_converter
+
+
+def set_default_converter(converter):
+    """Sets the converter used by `ImageCreator.create_async` and
+    `CollectionCreator.create_async`, such as one allowing more conversions at
+    once."""
+    global _default_converter
+    with _default_converter_lock:
+        _default_converter = converter
@@ -1,7 +1,11 @@
+import io
+import itertools
 import math
+from array import array
 from collections import deque
 import xml.dom.minidom
 import os
+import time
 import warnings
 
 import PIL.Image
@@ -9,19 +13,44 @@ import PIL.Image
 from ._utils import (
     get_or_create_path,
     get_files_path,
+    is_remote,
+    open_stream,
     remove,
     safe_open,
 )
+from ._dedup import TileDeduplicator, link_tile
 from ._defaults import NS_DEEPZOOM
+from ._encoder import get_encoder_options, write_tile
+from ._executor import BoundedExecutor
+from .fetcher import get_default_fetcher
+from . import _morton as morton
 from ._image_descriptor import DeepZoomImageDescriptor
+from ._xml import XMLWriter, iterparse
+from .stats import BuildStats
 
 
 __all__ = (
     "DeepZoomCollection",
+    "DeepZoomCollectionItem",
+    "DeepZoomCollectionItems",
+    "DeepZoomCollectionLayout",
 )
 
 
 class DeepZoomCollection(object):
+    """Deep Zoom collection (DZC).
+
+    `items` are existing items whose images are already in the collection
+    tiles, such as the items of an opened collection descriptor. They are kept
+    in the descriptor as they are. Items added with `append` are pending until
+    `save` renders them into the tiles they fall into, leaving all other tiles
+    untouched.
+
+    `encoder_preset` and `encoder_options` select tile encoder options as for
+    `ImageCreator`. In dedup mode identical tiles are encoded once and linked
+    as in `ImageCreator`, within every work unit.
+    """
+
     def __init__(
         self,
         filename,
@@ -31,6 +60,10 @@ class DeepZoomCollection(object):
         tile_format="jpg",
         tile_background_color="#000000",
         items=[],
+        next_item_id=None,
+        encoder_preset="default",
+        encoder_options=None,
+        dedup=False,
     ):
         self.source = filename
         self.image_quality = image_quality
@@ -38,119 +71,457 @@ class DeepZoomCollection(object):
         self.max_level = max_level
         self.tile_format = tile_format
         self.tile_background_color = tile_background_color
-        self.items = deque(items)
-        self.next_item_id = len(self.items)
-        # XML
-        self.doc = xml.dom.minidom.Document()
-        collection = self.doc.createElementNS(NS_DEEPZOOM, "Collection")
-        collection.setAttribute("xmlns", NS_DEEPZOOM)
-        collection.setAttribute("MaxLevel", str(self.max_level))
-        collection.setAttribute("TileSize", str(self.tile_size))
-        collection.setAttribute("Format", str(self.tile_format))
-        collection.setAttribute("Quality", str(self.image_quality))
-        # TODO: Append items passed in as argument
-        items = self.doc.createElementNS(NS_DEEPZOOM, "Items")
-        collection.appendChild(items)
-        collection.setAttribute("NextItemId", str(self.next_item_id))
-        self.doc.appendChild(collection)
+        self.encoder_options = get_encoder_options(
+            tile_format, encoder_preset, encoder_options
+        )
+        self.dedup = dedup
+        self.items = deque()
+        # Items are iterated more than once, and only descriptors read again
+        if not isinstance(items, DeepZoomCollectionItems):
+            items = list(items)
+        self.existing_items = items
+        if next_item_id is None:
+            next_item_id = max([item.id + 1 for item in items] + [0])
+        self.next_item_id = next_item_id
 
     @classmethod
     def from_file(self, filename):
-        """Open collection descriptor."""
-        doc = xml.dom.minidom.parse(safe_open(filename))
-        collection = doc.getElementsByTagName("Collection")[0]
-        image_quality = float(collection.getAttribute("Quality"))
-        max_level = int(collection.getAttribute("MaxLevel"))
-        tile_size = int(collection.getAttribute("TileSize"))
-        tile_format = collection.getAttribute("Format")
-        items = [
-            DeepZoomCollectionItem.from_xml(item)
-            for item in doc.getElementsByTagName("I")
-        ]
+        """Open collection descriptor.
 
+        Only the collection attributes are read up front. Its items are read
+        incrementally whenever they are needed, such as when saving.
+        """
+        with open_stream(filename) as file:
+            for (_, _, collection) in iterparse(file, ("Collection",)):
+                break
+        next_item_id = None
+        if "NextItemId" in collection.attrib:
+            next_item_id = int(collection.get("NextItemId"))
         collection = DeepZoomCollection(
             filename,
-            image_quality=image_quality,
-            max_level=max_level,
-            tile_size=tile_size,
-            tile_format=tile_format,
-            items=items,
+            image_quality=float(collection.get("Quality")),
+            max_level=int(collection.get("MaxLevel")),
+            tile_size=int(collection.get("TileSize")),
+            tile_format=collection.get("Format"),
+            items=DeepZoomCollectionItems(filename),
+            next_item_id=next_item_id,
         )
         return collection
 
+    @classmethod
+    def iter_items(self, filename):
+        """Iterator for the items of a collection descriptor, parsed
+        incrementally. Returns `DeepZoomCollectionItem`s."""
+        with open_stream(filename) as file:
+            for (event, name, element) in iterparse(file, ("I", "Size")):
+                if event != "end":
+                    continue
+                if name == "Size":
+                    size = element
+                else:
+                    yield DeepZoomCollectionItem(
+                        element.get("Source"),
+                        int(size.get("Width")),
+                        int(size.get("Height")),
+                        int(element.get("Id")),
+                    )
+
+    @property
+    def doc(self):
+        """Collection descriptor as `xml.dom.minidom` document, including
+        pending items. This holds every item in memory; prefer `write`."""
+        return xml.dom.minidom.parseString(self.to_xml())
+
     @classmethod
     def remove(self, filename):
         """Remove collection file (DZC) and tiles folder."""
         remove(filename)
 
     def append(self, source):
+        self._append_descriptor(source, self._open_descriptor(source))
+
+    def extend(self, sources):
+        """Appends many images, opening their descriptors concurrently on the
+        threads of the default fetcher (see `deepzoom.fetcher`)."""
+        sources = list(sources)
+        descriptors = get_default_fetcher().map(self._open_descriptor, sources)
+        for (source, descriptor) in zip(sources, descriptors):
+            self._append_descriptor(source, descriptor)
+
+    def _open_descriptor(self, source):
         descriptor = DeepZoomImageDescriptor()
         descriptor.open(source)
+        return descriptor
+
+    def _append_descriptor(self, source, descriptor):
         item = DeepZoomCollectionItem(
-            source, descriptor.width, descriptor.height, id=self.next_item_id
+            source,
+            descriptor.width,
+            descriptor.height,
+            id=self.next_item_id,
+            descriptor=descriptor,
         )
         self.items.append(item)
         self.next_item_id += 1
 
-    def save(self, pretty_print_xml=False):
-        """Save collection descriptor."""
-        collection = self.doc.getElementsByTagName("Collection")[0]
-        items = self.doc.getElementsByTagName("Items")[0]
-        while len(self.items) > 0:
-            item = self.items.popleft()
-            i = self.doc.createElementNS(NS_DEEPZOOM, "I")
-            i.setAttribute("Id", str(item.id))
-            i.setAttribute("N", str(item.id))
-            i.setAttribute("Source", item.source)
-            # Size
-            size = self.doc.createElementNS(NS_DEEPZOOM, "Size")
-            size.setAttribute("Width", str(item.width))
-            size.setAttribute("Height", str(item.height))
-            i.appendChild(size)
-            items.appendChild(i)
-            self._append_image(item.source, item.id)
-        collection.setAttribute("NextItemId", str(self.next_item_id))
-        with open(self.source, "wb") as f:
-            if pretty_print_xml:
-                xml = self.doc.toprettyxml(encoding="UTF-8")
+    def save(self, pretty_print_xml=False, workers=1, progress=None, stats=None):
+        """Save collection descriptor.
+
+        With more than one worker, the collection tiles are split into disjoint
+        work units that are rendered on a process pool. `progress` is called
+        with (level, tiles_done, tiles_total) whenever a work unit is done, as
+        by `ImageCreator.create`, where level is None as units span levels. A
+        `BuildStats` passed as `stats` collects the time spent decoding item
+        images, composing, encoding and writing tiles, and counts items, tiles
+        and bytes written, and in dedup mode deduplicated tiles and the bytes
+        they saved.
+        """
+        appended = list(self.items)
+        self.items.clear()
+        self._append_images(appended, workers, progress, stats)
+        temp_path = self.source + ".part"
+        with open(temp_path, "wb") as f:
+            self.write(f, appended, pretty_print_xml)
+        os.replace(temp_path, self.source)
+        self.existing_items = DeepZoomCollectionItems(self.source)
+
+    def save_items(
+        self,
+        sources,
+        create_item,
+        pretty_print_xml=False,
+        workers=1,
+        progress=None,
+        stats=None,
+    ):
+        """Appends items whose images are produced on the way, such as by
+        creating their Deep Zoom images, and saves collection descriptor.
+
+        `create_item(source, collect_stats)` is called for every source on a
+        process pool and returns (descriptor path, width, height, level images,
+        stats), where level images map collection levels to images. The tiles
+        are composed in the same pass from the returned images, in Z-order, so
+        only a few items and one tile per level are held in memory at once.
+        Pending items added with `append` are saved first, as by `save`, and
+        `progress` and `stats` are as for `save`.
+        """
+        appended = list(self.items)
+        self.items.clear()
+        if appended:
+            self._append_images(appended, workers, progress, stats)
+        items = []
+        for source in sources:
+            items.append(DeepZoomCollectionItem(source, 0, 0, id=self.next_item_id))
+            self.next_item_id += 1
+        layout = self.plan_layout(items)
+        files_path = get_or_create_path(get_files_path(self.source))
+        dedup = TileDeduplicator() if self.dedup else None
+        open_tiles = {}
+        levels = list(range(self.max_level + 1))
+        tiles_total = len(layout.tiles)
+        tiles_done = [0]
+        if stats is not None:
+            stats.count("items", len(items))
+
+        def done(item):
+            def callback(result):
+                item.source, item.width, item.height, images, item_stats = result
+                if item_stats is not None:
+                    stats.update(item_stats)
+                tiles_done[0] += self._paste_item(
+                    layout, open_tiles, files_path, item, levels, images, dedup, stats
+                )
+                if progress is not None:
+                    progress(None, tiles_done[0], tiles_total)
+
+            return callback
+
+        with BoundedExecutor(workers, processes=True) as executor:
+            for item in layout.items:
+                executor.submit(
+                    create_item, item.source, stats is not None, callback=done(item)
+                )
+        temp_path = self.source + ".part"
+        with open(temp_path, "wb") as f:
+            self.write(f, appended + items, pretty_print_xml)
+        os.replace(temp_path, self.source)
+        self.existing_items = DeepZoomCollectionItems(self.source)
+
+    def to_xml(self, pretty_print_xml=False):
+        """Collection descriptor, including pending items, as UTF-8 encoded
+        XML."""
+        file = io.BytesIO()
+        self.write(file, self.items, pretty_print_xml)
+        return file.getvalue()
+
+    def write(self, file, items=(), pretty_print_xml=False):
+        """Write collection descriptor with the existing and the given items
+        to a binary file object, one item at a time."""
+        writer = XMLWriter(file, pretty_print_xml)
+        writer.start(
+            "Collection",
+            (
+                ("xmlns", NS_DEEPZOOM),
+                ("MaxLevel", self.max_level),
+                ("TileSize", self.tile_size),
+                ("Format", self.tile_format),
+                ("Quality", self.image_quality),
+                ("NextItemId", self.next_item_id),
+            ),
+        )
+        empty = True
+        for item in itertools.chain(self.existing_items, items):
+            if empty:
+                writer.start("Items")
+                empty = False
+            writer.start(
+                "I", (("Id", item.id), ("N", item.id), ("Source", item.source))
+            )
+            writer.element("Size", (("Width", item.width), ("Height", item.height)))
+            writer.end("I")
+        if empty:
+            writer.element("Items")
+        else:
+            writer.end("Items")
+        writer.end("Collection")
+
+    def _append_images(self, items, workers=1, progress=None, stats=None):
+        layout = self.plan_layout(items)
+        get_or_create_path(get_files_path(self.source))
+        units = self._get_work_units(layout, workers)
+        tiles_total = len(layout.tiles)
+        tiles_done = [0]
+        if stats is not None:
+            stats.count("items", len(items))
+
+        def done(result):
+            num_tiles, unit_stats = result
+            tiles_done[0] += num_tiles
+            if unit_stats is not None:
+                stats.update(unit_stats)
+            if progress is not None:
+                progress(None, tiles_done[0], tiles_total)
+
+        arguments = {
+            "filename": self.source,
+            "image_quality": self.image_quality,
+            "max_level": self.max_level,
+            "tile_size": self.tile_size,
+            "tile_format": self.tile_format,
+            "tile_background_color": self.tile_background_color,
+            "encoder_options": self.encoder_options,
+            "dedup": self.dedup,
+        }
+        with BoundedExecutor(workers, processes=True) as executor:
+            for (unit_items, unit_tiles) in units:
+                executor.submit(
+                    _render_tiles,
+                    arguments,
+                    unit_items,
+                    unit_tiles,
+                    stats is not None,
+                    callback=done,
+                )
+
+    def _get_work_units(self, layout, workers):
+        """Splits the tiles of a layout into disjoint work units. Returns a list
+        of (items, tiles).
+
+        Every tile at the split level forms a unit with all tiles above it,
+        which only hold items of that tile, and every tile below the split level
+        forms a unit of its own. The split level is the lowest level with enough
+        tiles to keep all workers busy.
+        """
+        if workers <= 1:
+            return [(layout.items, set(layout.tiles))]
+        split_level = self.max_level
+        for level in range(self.max_level + 1):
+            if len([tile for tile in layout.tiles if tile[0] == level]) >= workers * 4:
+                split_level = level
+                break
+        units = {}
+        for tile in sorted(layout.tiles):
+            level, column, row = tile
+            if level > split_level:
+                shift = level - split_level
+                key = (split_level, column >> shift, row >> shift)
             else:
-                xml = self.doc.toxml(encoding="UTF-8")
-            f.write(xml)
+                key = tile
+            units.setdefault(key, set()).add(tile)
+        return [(layout.tiles[key], tiles) for (key, tiles) in units.items()]
 
-    def _append_image(self, path, i):
-        descriptor = DeepZoomImageDescriptor()
-        descriptor.open(path)
+    def render_tiles(self, items, tiles, stats=None):
+        """Composes the given collection tiles (level, column, row) from the
+        given items, which must include all items of those tiles.
+
+        Items are visited in Z-order and every tile is kept in memory until its
+        last item has been pasted, so each tile is encoded exactly once. The
+        images of remote items are fetched a few items ahead, concurrently.
+        Timings and counters are added to `stats`, if given.
+        """
+        layout = self.plan_layout(items)
         files_path = get_or_create_path(get_files_path(self.source))
-        for level in reversed(range(self.max_level + 1)):
-            level_path = get_or_create_path("%s/%s" % (files_path, level))
-            level_size = 2 ** level
-            images_per_tile = int(math.floor(self.tile_size / level_size))
-            column, row = self.get_tile_position(i, level, self.tile_size)
-            tile_path = "%s/%s_%s.%s" % (level_path, column, row, self.tile_format)
-            if not os.path.exists(tile_path):
-                tile_image = PIL.Image.new(
-                    "RGB", (self.tile_size, self.tile_size), self.tile_background_color
+        dedup = TileDeduplicator() if self.dedup else None
+        open_tiles = {}
+        work = []
+        for item in layout.items:
+            levels = [
+                level
+                for level in range(self.max_level + 1)
+                if layout.get_tile(item, level) in tiles
+            ]
+            if levels:
+                work.append((item, levels))
+        fetcher = get_default_fetcher()
+        if stats is not None:
+            fetcher_hits = fetcher.memory.hits
+            fetcher_misses = fetcher.memory.misses
+        lookahead = fetcher.workers * 2
+        for (item, _) in work[:lookahead]:
+            self._prefetch(fetcher, item)
+        for (i, (item, levels)) in enumerate(work):
+            if i + lookahead < len(work):
+                self._prefetch(fetcher, work[i + lookahead][0])
+            if stats is not None:
+                start = time.perf_counter()
+            images = dict(
+                self._get_level_images(item.source, levels, item.descriptor)
+            )
+            if stats is not None:
+                stats.add_time("decode", time.perf_counter() - start)
+            self._paste_item(
+                layout, open_tiles, files_path, item, levels, images, dedup, stats
+            )
+        if stats is not None:
+            stats.count("fetch_cache_hits", fetcher.memory.hits - fetcher_hits)
+            stats.count("fetch_cache_misses", fetcher.memory.misses - fetcher_misses)
+
+    def _paste_item(
+        self, layout, open_tiles, files_path, item, levels, images, dedup, stats
+    ):
+        """Pastes the level images of an item into its tiles at the given
+        levels, opening them as needed, and saves the tiles whose last item it
+        is. Returns the number of tiles saved."""
+        if stats is not None:
+            composed = time.perf_counter()
+        num_tiles = 0
+        column, row = self.get_position(item.id)
+        for level in reversed(levels):
+            tile = layout.get_tile(item, level)
+            if tile not in open_tiles:
+                open_tiles[tile] = self._open_tile(files_path, *tile)
+            image = images.get(level)
+            if image is not None:
+                level_size = 2 ** level
+                images_per_tile = int(math.floor(self.tile_size / level_size))
+                x = (column % images_per_tile) * level_size
+                y = (row % images_per_tile) * level_size
+                open_tiles[tile].paste(image, (x, y))
+            if layout.tiles[tile][-1] is item:
+                if stats is not None:
+                    stats.add_time("compose", time.perf_counter() - composed)
+                self._write_tile(files_path, open_tiles.pop(tile), tile, dedup, stats)
+                num_tiles += 1
+                if stats is not None:
+                    composed = time.perf_counter()
+        if stats is not None:
+            stats.add_time("compose", time.perf_counter() - composed)
+        return num_tiles
+
+    def _prefetch(self, fetcher, item):
+        if not is_remote(item.source):
+            return
+        if item.descriptor is None:
+            fetcher.prefetch(item.source)
+        else:
+            fetcher.prefetch(
+                self._get_source_tile_path(
+                    item.source, item.descriptor, self.max_level
                 )
-                if self.tile_format == "jpg":
-                    jpeg_quality = int(self.image_quality * 100)
-                    tile_image.save(tile_path, "JPEG", quality=jpeg_quality)
-                else:
-                    tile_image.save(tile_path)
-            tile_image = PIL.Image.open(tile_path)
-            source_path = "%s/%s/%s_%s.%s" % (
-                get_files_path(path),
-                level,
-                0,
-                0,
-                descriptor.tile_format,
             )
+
+    def _get_source_tile_path(self, path, descriptor, level):
+        return "%s/%s/%s_%s.%s" % (
+            get_files_path(path),
+            level,
+            0,
+            0,
+            descriptor.tile_format,
+        )
+
+    def _get_tile_path(self, files_path, level, column, row):
+        level_path = get_or_create_path("%s/%s" % (files_path, level))
+        return "%s/%s_%s.%s" % (level_path, column, row, self.tile_format)
+
+    def _open_tile(self, files_path, level, column, row):
+        tile_path = self._get_tile_path(files_path, level, column, row)
+        if os.path.exists(tile_path):
+            tile_image = PIL.Image.open(tile_path)
+            tile_image.load()
+            return tile_image
+        return PIL.Image.new(
+            "RGB", (self.tile_size, self.tile_size), self.tile_background_color
+        )
+
+    def _write_tile(self, files_path, tile_image, tile, dedup=None, stats=None):
+        """Saves a composed tile, or links it to an identical tile saved before
+        if deduplicating."""
+        if dedup is not None:
+            if stats is not None:
+                start = time.perf_counter()
+            key = dedup.get_key(tile_image)
+            original = dedup.get(key)
+            if stats is not None:
+                stats.add_time("hash", time.perf_counter() - start)
+            if original is not None:
+                start = time.perf_counter()
+                tile_path, num_bytes = original
+                link_tile(tile_path, self._get_tile_path(files_path, *tile))
+                if stats is not None:
+                    stats.add_time("write", time.perf_counter() - start)
+                    stats.count("tiles_deduplicated")
+                    stats.count("bytes_saved", num_bytes)
+                return
+        result = self._save_tile(files_path, tile_image, *tile)
+        if dedup is not None:
+            dedup.add(key, (self._get_tile_path(files_path, *tile), result[2]))
+        if stats is not None:
+            encode_seconds, write_seconds, num_bytes = result
+            stats.add_time("encode", encode_seconds)
+            stats.add_time("write", write_seconds)
+            stats.count("tiles")
+            stats.count("bytes", num_bytes)
+
+    def _save_tile(self, files_path, tile_image, level, column, row):
+        tile_path = self._get_tile_path(files_path, level, column, row)
+        return write_tile(
+            tile_image,
+            tile_path,
+            self.tile_format,
+            self.image_quality,
+            self.encoder_options,
+        )
+
+    def _get_level_images(self, path, levels=None, descriptor=None):
+        """Iterator for the images of a Deep Zoom image at all collection levels,
+        or at the given levels, from the highest level down. Returns (level,
+        image)."""
+        if levels is None:
+            levels = range(self.max_level + 1)
+        if descriptor is None:
+            descriptor = self._open_descriptor(path)
+        for level in reversed(range(min(levels), self.max_level + 1)):
+            source_path = self._get_source_tile_path(path, descriptor, level)
             # Local
             if os.path.exists(source_path):
+                if level not in levels:
+                    continue
                 try:
                     source_image = PIL.Image.open(safe_open(source_path))
                 except IOError:
                     warnings.warn("Skipped invalid level: %s" % source_path)
                     continue
+                w, h = source_image.size
             # Remote
             else:
                 if level == self.max_level:
@@ -175,53 +546,91 @@ class DeepZoomCollection(object):
                 else:
                     w = int(math.ceil(w * 0.5))
                     h = int(math.ceil(h * 0.5))
+                    source_image = source_image.copy()
                     source_image.thumbnail((w, h), PIL.Image.Resampling.LANCZOS)
-            column, row = self.get_position(i)
-            x = (column % images_per_tile) * level_size
-            y = (row % images_per_tile) * level_size
-            tile_image.paste(source_image, (x, y))
-            tile_image.save(tile_path)
+            if level in levels:
+                yield (level, source_image)
 
     def get_position(self, z_order):
         """Returns position (column, row) from given Z-order (Morton number.)"""
-        column = 0
-        row = 0
-        for i in range(0, 32, 2):
-            offset = i // 2
-            # column
-            column_offset = i
-            column_mask = 1 << column_offset
-            column_value = (z_order & column_mask) >> column_offset
-            column |= column_value << offset
-            # row
-            row_offset = i + 1
-            row_mask = 1 << row_offset
-            row_value = (z_order & row_mask) >> row_offset
-            row |= row_value << offset
-        return int(column), int(row)
+        return morton.decode(z_order)
+
+    def get_positions(self, z_orders):
+        """Returns positions as arrays (columns, rows) from given Z-orders."""
+        return morton.decode_many(z_orders)
 
     def get_z_order(self, column, row):
         """Returns the Z-order (Morton number) from given position."""
-        z_order = 0
-        for i in range(32):
-            z_order |= (column & 1 << i) << i | (row & 1 << i) << (i + 1)
-        return z_order
+        return morton.encode(column, row)
 
     def get_tile_position(self, z_order, level, tile_size):
-        level_size = 2 ** level
         x, y = self.get_position(z_order)
-        return (
-            int(math.floor((x * level_size) / tile_size)),
-            int(math.floor((y * level_size) / tile_size)),
+        return ((x << level) // tile_size, (y << level) // tile_size)
+
+    def get_tile_positions(self, z_orders, tile_size, levels=None):
+        """Returns the tile positions of the given Z-orders at every level, or at
+        the given levels, as a dictionary mapping each level to arrays (columns,
+        rows)."""
+        if levels is None:
+            levels = range(self.max_level + 1)
+        xs, ys = self.get_positions(z_orders)
+        positions = {}
+        for level in levels:
+            positions[level] = (
+                array("L", [(x << level) // tile_size for x in xs]),
+                array("L", [(y << level) // tile_size for y in ys]),
+            )
+        return positions
+
+    def plan_layout(self, items):
+        """Returns the layout of the given items in the collection tiles."""
+        items = sorted(items, key=lambda item: item.id)
+        levels = range(self.max_level + 1)
+        positions = self.get_tile_positions(
+            [item.id for item in items], self.tile_size, levels
         )
+        layout = DeepZoomCollectionLayout(items)
+        for level in levels:
+            columns, rows = positions[level]
+            for (item, column, row) in zip(items, columns, rows):
+                tile = (level, column, row)
+                layout.item_tiles[item.id].append(tile)
+                layout.tiles.setdefault(tile, []).append(item)
+        return layout
+
+
+def _render_tiles(arguments, items, tiles, collect_stats):
+    collection = DeepZoomCollection(**arguments)
+    stats = BuildStats() if collect_stats else None
+    collection.render_tiles(items, tiles, stats)
+    return (len(tiles), stats)
+
+
+class DeepZoomCollectionLayout(object):
+    """Layout of collection items in the collection tiles.
+
+    `tiles` maps every tile (level, column, row) to its items in Z-order, and
+    `item_tiles` maps every item id to its tile at each level.
+    """
+
+    def __init__(self, items):
+        self.items = items
+        self.tiles = {}
+        self.item_tiles = dict((item.id, []) for item in items)
+
+    def get_tile(self, item, level):
+        """Returns the tile (level, column, row) of an item at the given level."""
+        return self.item_tiles[item.id][level]
 
 
 class DeepZoomCollectionItem(object):
-    def __init__(self, source, width, height, id=0):
+    def __init__(self, source, width, height, id=0, descriptor=None):
         self.id = id
         self.source = source
         self.width = width
         self.height = height
+        # Descriptor of the source, if already opened
+        self.descriptor = descriptor
 
     @classmethod
     def from_xml(cls, xml):
@@ -230,4 +639,15 @@ class DeepZoomCollectionItem(object):
         size = xml.getElementsByTagName("Size")[0]
         width = int(size.getAttribute("Width"))
         height = int(size.getAttribute("Height"))
-        return DeepZoomCollectionItem(source, width, height, id)
\ No newline at end of file
+        return DeepZoomCollectionItem(source, width, height, id)
+
+
+class DeepZoomCollectionItems(object):
+    """Items of a collection descriptor, read incrementally every time they are
+    iterated."""
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __iter__(self):
+        return DeepZoomCollection.iter_items(self.filename)
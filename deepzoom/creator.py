@@ -1,15 +1,41 @@
+import functools
+import math
 import os
+import shutil
+import time
+from urllib.parse import urlparse
 import PIL.Image
 
 from ._utils import (
     get_or_create_path,
     get_files_path,
+    get_manifest_path,
+    get_pack_path,
+    get_shards_path,
     clamp,
     safe_open,
 )
-from ._defaults import IMAGE_FORMATS, DEFAULT_IMAGE_FORMAT, RESIZE_FILTERS
+from .aio import get_default_converter
+from ._dedup import TileDeduplicator, link_tile
+from ._encoder import encode_tile_timed, get_encoder_options, write_tile
+from ._executor import BoundedExecutor
+from ._defaults import (
+    IMAGE_FORMATS,
+    DEFAULT_IMAGE_FORMAT,
+    PACK_EXTENSION,
+    RESIZE_FILTERS,
+)
 from ._image_descriptor import DeepZoomImageDescriptor
+from ._manifest import (
+    BuildManifest,
+    ShardManifest,
+    fingerprint_file,
+    fingerprint_image,
+)
+from ._streaming import FILTER_MARGIN, LevelStream, iter_strips, read_region
 from .collection import DeepZoomCollection
+from .stats import BuildStats
+from .tile_pack import TilePackWriter
 
 
 __all__ = (
@@ -17,9 +43,26 @@ __all__ = (
     "CollectionCreator"
 )
 
+# Largest width and height of the default merge level of sharded builds
+MERGE_SIZE = 4096
+
+# Support of the widest resize filter (LANCZOS), in destination pixels
+FILTER_SUPPORT = 3
+
 
 class ImageCreator(object):
-    """Creates Deep Zoom images."""
+    """Creates Deep Zoom images.
+
+    Tiles can be encoded as "jpg", "png" and, if Pillow supports them, "webp"
+    and "avif". `encoder_preset` selects encoder options that trade encoding
+    speed for size ("fast", "default" or "small"), and `encoder_options`
+    overrides individual Pillow save options.
+
+    In dedup mode tiles with identical pixels, such as those of uniform
+    margins, are encoded once. The duplicates are hard links to the first tile
+    (or copies where hard links are not supported), or share its bytes in a
+    pack.
+    """
 
     def __init__(
         self,
@@ -29,6 +72,17 @@ class ImageCreator(object):
         image_quality=0.8,
         resize_filter=None,
         copy_metadata=False,
+        cascade=False,
+        workers=1,
+        use_processes=False,
+        streaming=False,
+        strip_height=None,
+        packed=False,
+        resumable=False,
+        encoder_preset="default",
+        encoder_options=None,
+        dedup=False,
+        draft=False,
     ):
         self.tile_size = int(tile_size)
         self.tile_format = tile_format
@@ -38,6 +92,25 @@ class ImageCreator(object):
             self.tile_format = DEFAULT_IMAGE_FORMAT
         self.resize_filter = resize_filter
         self.copy_metadata = copy_metadata
+        self.cascade = cascade
+        self.workers = max(int(workers), 1)
+        self.use_processes = use_processes
+        self.streaming = streaming
+        self.strip_height = int(strip_height or self.tile_size)
+        self.packed = packed
+        self.resumable = resumable
+        self.encoder_preset = encoder_preset
+        self.encoder_options = get_encoder_options(
+            self.tile_format, encoder_preset, encoder_options
+        )
+        self.dedup = dedup
+        self.draft = draft
+
+    def get_resize_filter(self):
+        """Returns the PIL resampling filter used for resizing levels."""
+        if (self.resize_filter is None) or (self.resize_filter not in RESIZE_FILTERS):
+            return PIL.Image.Resampling.LANCZOS
+        return RESIZE_FILTERS[self.resize_filter]
 
     def get_image(self, level):
         """Returns the bitmap image at the given level."""
@@ -47,24 +120,186 @@ class ImageCreator(object):
         width, height = self.descriptor.get_dimensions(level)
         # don't transform to what we already have
         if self.descriptor.width == width and self.descriptor.height == height:
+            if self._draft_source is not None and self._stats is not None:
+                # Deferred in draft mode, in case no level needs it
+                start = time.perf_counter()
+                self.image.load()
+                self._add_decode_time(time.perf_counter() - start)
             return self.image
-        if (self.resize_filter is None) or (self.resize_filter not in RESIZE_FILTERS):
-            return self.image.resize((width, height), PIL.Image.Resampling.LANCZOS)
-        return self.image.resize((width, height), RESIZE_FILTERS[self.resize_filter])
+        if self.draft:
+            image = self._get_draft_image(width, height)
+            if image is not None:
+                return image.resize((width, height), self.get_resize_filter())
+        return self.image.resize((width, height), self.get_resize_filter())
+
+    def _get_draft_image(self, width, height):
+        """Returns a JPEG source decoded at the smallest scale (1/2, 1/4 or 1/8)
+        that is at least twice the given size, or None if there is none."""
+        if self._draft_source is None:
+            return None
+        scale = 1
+        while scale < 8 and (
+            -(-self.descriptor.width // (scale * 2)) >= width * 2
+            and -(-self.descriptor.height // (scale * 2)) >= height * 2
+        ):
+            scale *= 2
+        if scale == 1:
+            return None
+        # Levels get smaller, so only the last scale is kept
+        if self._draft_image is None or self._draft_image[0] != scale:
+            self._draft_image = None
+            start = time.perf_counter()
+            if hasattr(self._draft_source, "seek"):
+                self._draft_source.seek(0)
+            image = PIL.Image.open(self._draft_source)
+            image.draft(
+                image.mode,
+                (self.descriptor.width // scale, self.descriptor.height // scale),
+            )
+            image.load()
+            if self._stats is not None:
+                self._add_decode_time(time.perf_counter() - start)
+            self._draft_image = (scale, image)
+        return self._draft_image[1]
+
+    def _add_decode_time(self, seconds):
+        # Spent while producing a level, which `create` counts as resizing
+        self._stats.add_time("decode", seconds)
+        self._stats.add_time("resize", -seconds)
+
+    def get_images(self, levels=None):
+        """Iterator for the bitmap images of all levels, or of the given levels,
+        from the highest level down. Returns (level, image).
+
+        In cascade mode every level is produced by halving the level above it
+        instead of resizing the full-resolution source, so the whole pyramid
+        costs roughly two passes over the source pixels. The previous level is
+        released as soon as the next one exists. The filter's ringing at sharp
+        edges adds up from level to level, so levels differ from the direct
+        resize by a mean error below 1 value per channel for photographic
+        content and up to about 3 for content made of hard edges, such as
+        diagrams, text or line art. Single pixels at such edges can differ by
+        up to about 25 values.
+        """
+        if levels is None:
+            levels = range(self.descriptor.num_levels)
+        if not levels:
+            return
+        lowest = min(levels)
+        image = None
+        for level in reversed(range(lowest, self.descriptor.num_levels)):
+            if self.cascade and image is not None:
+                width, height = self.descriptor.get_dimensions(level)
+                image = image.resize((width, height), self.get_resize_filter())
+            elif self.cascade or level in levels:
+                image = self.get_image(level)
+            if level in levels:
+                yield (level, image)
 
     def tiles(self, level):
         """Iterator for all tiles in the given level. Returns (column, row) of a tile."""
-        columns, rows = self.descriptor.get_num_tiles(level)
-        for column in range(columns):
-            for row in range(rows):
-                yield (column, row)
+        for (column, row) in self.descriptor.tile_grid(level):
+            yield (column, row)
+
+    def get_settings(self):
+        """Returns the settings that affect the output, as recorded in the build
+        manifest."""
+        return {
+            "tile_size": self.tile_size,
+            "tile_overlap": self.tile_overlap,
+            "tile_format": self.tile_format,
+            "image_quality": self.image_quality,
+            "resize_filter": str(self.resize_filter),
+            "cascade": self.cascade,
+            "streaming": self.streaming,
+            "packed": self.packed,
+            "draft": self.draft,
+            "encoder_options": self.encoder_options,
+        }
 
-    def create(self, source, destination):
-        """Creates Deep Zoom image from source file and saves it to destination."""
+    def _get_shard_settings(self):
+        """Returns the settings that affect the output of sharded builds, to
+        which cascade, streaming, draft and packed modes do not apply."""
+        settings = self.get_settings()
+        for name in ("cascade", "streaming", "draft", "packed"):
+            del settings[name]
+        return settings
+
+    def is_up_to_date(self, source, destination):
+        """Whether `destination` is a finished resumable build with the same
+        settings that is newer than the local file `source`. Unlike resuming,
+        this does not read the source."""
+        manifest = BuildManifest.open(get_manifest_path(destination))
+        if manifest is None or not manifest.complete:
+            return False
+        if manifest.settings != self.get_settings():
+            return False
+        try:
+            return os.path.getmtime(destination) >= os.path.getmtime(source)
+        except OSError:
+            return False
+
+    def create(self, source, destination, progress=None, stats=None):
+        """Creates Deep Zoom image from source file and saves it to destination.
+
+        `progress` is called with (level, tiles_done, tiles_total) whenever a
+        tile is done. A `BuildStats` passed as `stats` collects the time spent
+        decoding, resizing, cropping, encoding and writing, and counts levels,
+        tiles and bytes written. In dedup mode it also collects the time spent
+        hashing tiles and counts deduplicated tiles and the bytes they saved.
+
+        In streaming mode the source is read in horizontal strips and every
+        level only holds the few rows of tiles it is working on, so peak memory
+        is bounded by the image width rather than its size. Levels are built as
+        in cascade mode.
+
+        In draft mode, levels at most a quarter of the size of a JPEG source
+        are resized from the source decoded at a reduced scale (1/2, 1/4 or
+        1/8, see `PIL.Image.Image.draft`) that is still at least twice their
+        size, which costs a fraction of decoding and resizing the
+        full-resolution image. The full-resolution image is only decoded for
+        the levels above. Levels stay within a mean error of 1.5 values per
+        channel of the default mode, although single pixels along sharp edges
+        can differ by up to 50. Draft mode does not apply to cascade and
+        streaming modes.
+
+        In packed mode the tiles are written into a single pack file next to
+        the descriptor (see `TilePackWriter`) instead of a tiles folder.
+
+        In resumable mode a build manifest records the source fingerprint, the
+        settings and the completed levels. Running again with the same source
+        and settings skips completed levels and existing tiles, or does nothing
+        at all if the previous build finished. Packs are always rebuilt whole.
+        """
+        self._progress = progress
+        self._stats = stats
+        fingerprint = None
+        self._draft_source = None
+        self._draft_image = None
+        start = time.perf_counter()
         if isinstance(source, PIL.Image.Image):
             self.image = source
+            if self.resumable:
+                fingerprint = fingerprint_image(source)
+        elif os.path.exists(source):
+            self.image = PIL.Image.open(source)
+            self._draft_source = source
+            if self.resumable:
+                fingerprint = fingerprint_file(source)
         else:
-            self.image = PIL.Image.open(safe_open(source))
+            file = safe_open(source)
+            if self.resumable:
+                fingerprint = fingerprint_file(file)
+            self.image = PIL.Image.open(file)
+            self._draft_source = file
+        if not self.draft or self.cascade or self.streaming:
+            self._draft_source = None
+        elif self.image.format != "JPEG":
+            self._draft_source = None
+        if stats is not None:
+            if not self.streaming and self._draft_source is None:
+                self.image.load()
+            stats.add_time("decode", time.perf_counter() - start)
         width, height = self.image.size
         self.descriptor = DeepZoomImageDescriptor(
             width=width,
@@ -73,27 +308,777 @@ class ImageCreator(object):
             tile_overlap=self.tile_overlap,
             tile_format=self.tile_format,
         )
+        self._manifest = None
+        self._manifest_path = get_manifest_path(destination)
+        if self.resumable:
+            manifest = BuildManifest(fingerprint, self.get_settings())
+            previous = BuildManifest.open(self._manifest_path)
+            if previous is not None and previous.matches(manifest):
+                if previous.complete and os.path.exists(destination):
+                    return
+                if not self.packed:
+                    manifest.levels = previous.levels
+            elif previous is not None:
+                # Source or settings changed, start over
+                if os.path.exists(get_files_path(destination)):
+                    shutil.rmtree(get_files_path(destination))
+            manifest.save(self._manifest_path)
+            self._manifest = manifest
         # Create tiles
-        image_files = get_or_create_path(get_files_path(destination))
-        for level in range(self.descriptor.num_levels):
-            level_dir = get_or_create_path(os.path.join(image_files, str(level)))
-            level_image = self.get_image(level)
-            for (column, row) in self.tiles(level):
-                bounds = self.descriptor.get_tile_bounds(level, column, row)
-                tile = level_image.crop(bounds)
-                format = self.descriptor.tile_format
-                tile_path = os.path.join(level_dir, "%s_%s.%s" % (column, row, format))
-                if self.descriptor.tile_format == "jpg":
-                    jpeg_quality = int(self.image_quality * 100)
-                    tile.save(tile_path, "JPEG", quality=jpeg_quality)
+        self._dedup = TileDeduplicator() if self.dedup else None
+        self._encoder_options = self.encoder_options
+        self._pack = None
+        if self.packed:
+            self._pack = TilePackWriter(get_pack_path(destination))
+        else:
+            self._image_files = get_or_create_path(get_files_path(destination))
+        levels = range(self.descriptor.num_levels)
+        if self._manifest is not None and not self.streaming:
+            completed = self._manifest.levels
+            levels = [level for level in levels if level not in completed]
+        self._tiles_done = 0
+        self._tiles_total = sum(
+            len(self.descriptor.tile_grid(level)) for level in levels
+        )
+        try:
+            with BoundedExecutor(self.workers, self.use_processes) as executor:
+                self._executor = executor
+                if self.streaming:
+                    self._create_tiles_streaming()
                 else:
-                    tile.save(tile_path)
+                    images = self.get_images(levels)
+                    if stats is not None:
+                        images = _timed(images, stats, "resize")
+                    for (level, level_image) in images:
+                        self._save_tiles(level, level_image, self.tiles(level))
+                        self._complete_level(level)
+        except BaseException:
+            if self._pack is not None:
+                self._pack.abort()
+            raise
+        finally:
+            self._executor = None
+            self._draft_image = None
+        if self._pack is not None:
+            self._pack.close(self.descriptor)
         # Create descriptor
         self.descriptor.save(destination)
+        if self._manifest is not None:
+            self._manifest.complete = True
+            self._manifest.save(self._manifest_path)
+
+    async def create_async(
+        self, source, destination, progress=None, stats=None, converter=None
+    ):
+        """Awaitable variant of `create` for asyncio code. The conversion runs
+        off the event loop, among a bounded number of conversions at once, and
+        can be cancelled; see `AsyncConverter`. Uses the default converter
+        unless given one."""
+        if converter is None:
+            converter = get_default_converter()
+        await converter.create_image(
+            self, source, destination, progress=progress, stats=stats
+        )
+
+    def update_region(self, source, destination, rect, progress=None, stats=None):
+        """Regenerates the tiles of an existing Deep Zoom image that depend on
+        the rectangle (x1, y1, x2, y2) of its edited source, leaving all other
+        tiles untouched.
+
+        At every level, the tiles whose bounds, overlap included, intersect the
+        area that the rectangle affects are written again. The highest level is
+        cropped from the source: only the rows around the rectangle are read
+        from uncompressed sources (see `iter_strips`), other sources are
+        decoded in full. Every level below is resized from the updated region
+        of the level above, completed by its existing tiles, so the work done
+        is proportional to the edited area rather than to the image size.
+        Updated tiles stay within the tolerance of cascade mode of a full
+        build, plus the compression error of neighbouring tiles in lossy
+        formats.
+
+        Tile size, overlap and format are those of the existing image, whose
+        size the source must have. Tiles of another format than the creator's
+        are encoded with the options of `encoder_preset` for their format. Tile
+        packs cannot be updated. A build manifest of the destination is
+        removed, as it no longer matches the tiles. See `create` for `progress`
+        and `stats`.
+        """
+        self._progress = progress
+        self._stats = stats
+        self._draft_source = None
+        self._draft_image = None
+        start = time.perf_counter()
+        image = _open_image(source)
+        descriptor = DeepZoomImageDescriptor()
+        descriptor.open(destination)
+        if image.size != (descriptor.width, descriptor.height):
+            raise ValueError(
+                "Source size %sx%s differs from Deep Zoom image size %sx%s"
+                % (image.size + (descriptor.width, descriptor.height))
+            )
+        self._image_files = get_files_path(destination)
+        if not os.path.isdir(self._image_files):
+            raise ValueError("No tiles folder to update: %s" % self._image_files)
+        self.descriptor = descriptor
+        x1, y1, x2, y2 = rect
+        x1, x2 = clamp(x1, 0, descriptor.width), clamp(x2, 0, descriptor.width)
+        y1, y2 = clamp(y1, 0, descriptor.height), clamp(y2, 0, descriptor.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        # Tiles of every level, from the highest down, as (level, columns, rows)
+        regions = []
+        overlap = descriptor.tile_overlap
+        for level in reversed(range(descriptor.num_levels)):
+            if regions:
+                x1, y1, x2, y2 = self._get_affected_rect(level, (x1, y1, x2, y2))
+            columns, rows = descriptor.tiles_in_rect(
+                level, x1 - overlap, y1 - overlap, x2 + overlap, y2 + overlap
+            )
+            regions.append((level, columns, rows))
+        self._manifest = None
+        self._pack = None
+        self._dedup = TileDeduplicator() if self.dedup else None
+        if descriptor.tile_format == self.tile_format:
+            self._encoder_options = self.encoder_options
+        else:
+            # Options for the creator's format do not apply to the existing one
+            self._encoder_options = get_encoder_options(
+                descriptor.tile_format, self.encoder_preset
+            )
+        self._tiles_done = 0
+        self._tiles_total = sum(
+            len(columns) * len(rows) for (_, columns, rows) in regions
+        )
+        manifest_path = get_manifest_path(destination)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        above = None
+        try:
+            with BoundedExecutor(self.workers, self.use_processes) as executor:
+                self._executor = executor
+                for (level, columns, rows) in regions:
+                    left, top = descriptor.get_tile_bounds(level, columns[0], rows[0])[:2]
+                    right, bottom = descriptor.get_tile_bounds(
+                        level, columns[-1], rows[-1]
+                    )[2:]
+                    box = (left, top, right, bottom)
+                    if above is None:
+                        region = read_region(image, box)
+                        if stats is not None:
+                            stats.add_time("decode", time.perf_counter() - start)
+                    else:
+                        region = self._resize_region(level, box, above)
+                    tiles = ((column, row) for column in columns for row in rows)
+                    self._save_tiles(level, region, tiles, top, left)
+                    self._complete_level(level)
+                    above = (region, box, columns, rows)
+        finally:
+            self._executor = None
+
+    def _get_affected_rect(self, level, rect):
+        """Returns the rectangle of a level affected by a rectangle of the level
+        above."""
+        width, height = self.descriptor.get_dimensions(level)
+        width_above, height_above = self.descriptor.get_dimensions(level + 1)
+        scale_x = width_above / width
+        scale_y = height_above / height
+        x1, y1, x2, y2 = rect
+        return (
+            max(int(math.floor((x1 - FILTER_MARGIN) / scale_x)), 0),
+            max(int(math.floor((y1 - FILTER_MARGIN) / scale_y)), 0),
+            min(int(math.ceil((x2 + FILTER_MARGIN) / scale_x)), width),
+            min(int(math.ceil((y2 + FILTER_MARGIN) / scale_y)), height),
+        )
+
+    def _resize_region(self, level, box, above):
+        """Returns the region `box` of a level, resized from the updated region
+        of the level above and the existing tiles around it."""
+        stats = self._stats
+        image, (left, top, _, _), columns, rows = above
+        width, height = self.descriptor.get_dimensions(level)
+        width_above, height_above = self.descriptor.get_dimensions(level + 1)
+        scale_x = width_above / width
+        scale_y = height_above / height
+        x1, y1, x2, y2 = box
+        canvas_box = (
+            max(int(math.floor(x1 * scale_x)) - FILTER_MARGIN, 0),
+            max(int(math.floor(y1 * scale_y)) - FILTER_MARGIN, 0),
+            min(int(math.ceil(x2 * scale_x)) + FILTER_MARGIN, width_above),
+            min(int(math.ceil(y2 * scale_y)) + FILTER_MARGIN, height_above),
+        )
+        if stats is not None:
+            start = time.perf_counter()
+        canvas = PIL.Image.new(
+            image.mode,
+            (canvas_box[2] - canvas_box[0], canvas_box[3] - canvas_box[1]),
+        )
+        format = self.descriptor.tile_format
+        level_dir = os.path.join(self._image_files, str(level + 1))
+        tiles_columns, tiles_rows = self.descriptor.tiles_in_rect(
+            level + 1, *canvas_box
+        )
+        for column in tiles_columns:
+            for row in tiles_rows:
+                if column in columns and row in rows:
+                    # Being written again, and within the updated region
+                    continue
+                tile_path = os.path.join(level_dir, "%s_%s.%s" % (column, row, format))
+                with open(tile_path, "rb") as file:
+                    tile = PIL.Image.open(file)
+                    tile.load()
+                if tile.mode != canvas.mode:
+                    tile = tile.convert(canvas.mode)
+                tile_x, tile_y = self.descriptor.get_tile_bounds(level + 1, column, row)[:2]
+                canvas.paste(tile, (tile_x - canvas_box[0], tile_y - canvas_box[1]))
+        canvas.paste(image, (left - canvas_box[0], top - canvas_box[1]))
+        if stats is not None:
+            resized = time.perf_counter()
+            stats.add_time("decode", resized - start)
+        region = canvas.resize(
+            (x2 - x1, y2 - y1),
+            self.get_resize_filter(),
+            box=(
+                x1 * scale_x - canvas_box[0],
+                y1 * scale_y - canvas_box[1],
+                x2 * scale_x - canvas_box[0],
+                y2 * scale_y - canvas_box[1],
+            ),
+        )
+        if stats is not None:
+            stats.add_time("resize", time.perf_counter() - resized)
+        return region
+
+    def create_shard(
+        self,
+        source,
+        destination,
+        shard,
+        shards,
+        merge_level=None,
+        progress=None,
+        stats=None,
+    ):
+        """Creates shard number `shard` (from 0) of `shards` independent parts
+        of a Deep Zoom image, so that a build can be spread over processes or
+        hosts sharing the storage of the destination.
+
+        The tile rows of every level from the highest down to the merge level
+        are split into `shards` bands, and every shard writes its band of each
+        level, resized from the matching rows of the source. Only those rows
+        are read from uncompressed sources (see `iter_strips`). Each shard also
+        keeps its rows of the merge level as an uncompressed TIFF file, and
+        records what it wrote in a shard manifest, both in the `_shards` folder
+        next to the destination. Once all shards are done, `merge_shards`
+        builds the levels below the merge level and writes the descriptor.
+
+        The merge level defaults to the highest level at most `MERGE_SIZE`
+        pixels wide and high. Every tile row is resized on its own, so the
+        tiles do not depend on the number of shards, and stay within 1 value
+        per channel of `create`. Cascade, streaming, draft and packed modes do
+        not apply. A shard that already finished with the same settings is
+        skipped. See `create` for `progress` and `stats`.
+        """
+        if not 0 <= shard < shards:
+            raise ValueError("Invalid shard %s of %s" % (shard, shards))
+        self._progress = progress
+        self._stats = stats
+        self._draft_source = None
+        self._draft_image = None
+        start = time.perf_counter()
+        image = _open_image(source)
+        width, height = image.size
+        self.descriptor = DeepZoomImageDescriptor(
+            width=width,
+            height=height,
+            tile_size=self.tile_size,
+            tile_overlap=self.tile_overlap,
+            tile_format=self.tile_format,
+        )
+        if merge_level is None:
+            merge_level = _get_merge_level(self.descriptor)
+        shards_path = get_or_create_path(get_shards_path(destination))
+        manifest_path = os.path.join(shards_path, "shard-%s.json" % shard)
+        manifest = ShardManifest(
+            shard, shards, image.size, self._get_shard_settings(), merge_level
+        )
+        previous = ShardManifest.open(manifest_path)
+        if previous is not None and previous.complete and previous.matches(manifest):
+            return
+        levels = range(merge_level, self.descriptor.num_levels)
+        for level in levels:
+            rows = self.descriptor.get_num_tiles(level)[1]
+            manifest.rows[level] = (
+                rows * shard // shards,
+                rows * (shard + 1) // shards,
+            )
+        self._manifest = None
+        self._pack = None
+        self._dedup = TileDeduplicator() if self.dedup else None
+        self._encoder_options = self.encoder_options
+        self._image_files = get_or_create_path(get_files_path(destination))
+        self._tiles_done = 0
+        self._tiles_total = sum(
+            (last - first) * self.descriptor.get_num_tiles(level)[0]
+            for (level, (first, last)) in manifest.rows.items()
+        )
+        if stats is not None:
+            stats.add_time("decode", time.perf_counter() - start)
+        raster = None
+        try:
+            with BoundedExecutor(self.workers, self.use_processes) as executor:
+                self._executor = executor
+                for level in reversed(levels):
+                    grid = self.descriptor.tile_grid(level)
+                    first, last = manifest.rows[level]
+                    for row in range(first, last):
+                        y1, y2 = grid.y1[row], grid.y2[row]
+                        rows = self._get_level_rows(image, level, y1, y2)
+                        tiles = ((column, row) for column in range(grid.columns))
+                        self._save_tiles(level, rows, tiles, y1)
+                        if level == merge_level:
+                            raster = self._add_raster_rows(
+                                raster, level, rows, row, y1, first, last
+                            )
+                    self._complete_level(level)
+        finally:
+            self._executor = None
+        if raster is not None:
+            manifest.raster = "shard-%s.tif" % shard
+            raster_path = os.path.join(shards_path, manifest.raster)
+            raster.save(raster_path + ".part", format="TIFF")
+            os.replace(raster_path + ".part", raster_path)
+        manifest.complete = True
+        manifest.save(manifest_path)
+
+    def _get_level_rows(self, image, level, y1, y2):
+        """Returns the rows y1 to y2 of a level, resized from the rows of the
+        source they depend on."""
+        stats = self._stats
+        source_width, source_height = image.size
+        width, height = self.descriptor.get_dimensions(level)
+        if stats is not None:
+            start = time.perf_counter()
+        if (width, height) == image.size:
+            rows = read_region(image, (0, y1, width, y2))
+            if stats is not None:
+                stats.add_time("decode", time.perf_counter() - start)
+            return rows
+        scale = source_height / height
+        margin = int(math.ceil(FILTER_SUPPORT * scale)) + 1
+        top = max(int(math.floor(y1 * scale)) - margin, 0)
+        bottom = min(int(math.ceil(y2 * scale)) + margin, source_height)
+        rows = read_region(image, (0, top, source_width, bottom))
+        if stats is not None:
+            resized = time.perf_counter()
+            stats.add_time("decode", resized - start)
+        rows = rows.resize(
+            (width, y2 - y1),
+            self.get_resize_filter(),
+            box=(0, y1 * scale - top, source_width, y2 * scale - top),
+        )
+        if stats is not None:
+            stats.add_time("resize", time.perf_counter() - resized)
+        return rows
+
+    def _add_raster_rows(self, raster, level, rows, row, y1, first, last):
+        """Pastes a row of tiles of a level, without overlap, into the image of
+        the rows `first` to `last` of the level, which is created if None."""
+        width, height = self.descriptor.get_dimensions(level)
+        tile_size = self.descriptor.tile_size
+        top = first * tile_size
+        if raster is None:
+            raster = PIL.Image.new(
+                rows.mode, (width, min(last * tile_size, height) - top)
+            )
+        y = row * tile_size
+        interior = rows.crop((0, y - y1, width, min(y + tile_size, height) - y1))
+        raster.paste(interior, (0, y - top))
+        return raster
+
+    def merge_shards(self, destination, shards, progress=None, stats=None):
+        """Completes a Deep Zoom image created by `create_shard`.
+
+        Checks that all `shards` shards finished with the same source size,
+        settings and merge level, and that together they wrote every tile of
+        every level down to the merge level. Then builds the levels below from
+        the merge level, assembled from the rows kept by the shards, within the
+        tolerance of cascade mode of `create`, writes the descriptor and
+        removes the `_shards` folder. The creator must have the settings of the
+        shards. See `create` for `progress` and `stats`.
+        """
+        self._progress = progress
+        self._stats = stats
+        shards_path = get_shards_path(destination)
+        manifests = []
+        for shard in range(shards):
+            manifest = ShardManifest.open(
+                os.path.join(shards_path, "shard-%s.json" % shard)
+            )
+            if manifest is None or not manifest.complete:
+                raise ValueError(
+                    "Shard %s of %s is missing or unfinished: %s"
+                    % (shard, shards, shards_path)
+                )
+            if manifest.shard != shard or not manifest.matches(
+                manifests[0] if manifests else manifest
+            ):
+                raise ValueError(
+                    "Shard %s of %s belongs to another build" % (shard, shards)
+                )
+            manifests.append(manifest)
+        if manifests[0].shards != shards:
+            raise ValueError(
+                "Shards are parts of %s shards, not %s" % (manifests[0].shards, shards)
+            )
+        if manifests[0].settings != self._get_shard_settings():
+            raise ValueError("Shards were created with other settings")
+        width, height = manifests[0].size
+        merge_level = manifests[0].merge_level
+        self.descriptor = DeepZoomImageDescriptor(
+            width=width,
+            height=height,
+            tile_size=self.tile_size,
+            tile_overlap=self.tile_overlap,
+            tile_format=self.tile_format,
+        )
+        self._image_files = get_files_path(destination)
+        self._check_shard_tiles(manifests)
+        if stats is not None:
+            start = time.perf_counter()
+        image = None
+        for manifest in manifests:
+            if manifest.raster is None:
+                continue
+            raster = PIL.Image.open(os.path.join(shards_path, manifest.raster))
+            raster.load()
+            if image is None:
+                image = PIL.Image.new(
+                    raster.mode, self.descriptor.get_dimensions(merge_level)
+                )
+            first = manifest.rows[merge_level][0]
+            image.paste(raster, (0, first * self.descriptor.tile_size))
+        if stats is not None:
+            stats.add_time("decode", time.perf_counter() - start)
+        self._manifest = None
+        self._pack = None
+        self._dedup = TileDeduplicator() if self.dedup else None
+        self._encoder_options = self.encoder_options
+        levels = range(merge_level)
+        self._tiles_done = 0
+        self._tiles_total = sum(
+            len(self.descriptor.tile_grid(level)) for level in levels
+        )
+        try:
+            with BoundedExecutor(self.workers, self.use_processes) as executor:
+                self._executor = executor
+                for level in reversed(levels):
+                    if stats is not None:
+                        start = time.perf_counter()
+                    level_image = image.resize(
+                        self.descriptor.get_dimensions(level),
+                        self.get_resize_filter(),
+                    )
+                    if stats is not None:
+                        stats.add_time("resize", time.perf_counter() - start)
+                    self._save_tiles(level, level_image, self.tiles(level))
+                    self._complete_level(level)
+        finally:
+            self._executor = None
+        self.descriptor.save(destination)
+        shutil.rmtree(shards_path)
+
+    def _check_shard_tiles(self, manifests):
+        """Raises ValueError unless the shards wrote every row of their levels
+        once and every tile of those rows exists."""
+        format = self.descriptor.tile_format
+        for level in range(manifests[0].merge_level, self.descriptor.num_levels):
+            columns, rows = self.descriptor.get_num_tiles(level)
+            next_row = 0
+            for manifest in manifests:
+                first, last = manifest.rows[level]
+                if first != next_row:
+                    raise ValueError("Shards miss or repeat rows of level %s" % level)
+                next_row = last
+            if next_row != rows:
+                raise ValueError("Shards miss rows of level %s" % level)
+            level_dir = os.path.join(self._image_files, str(level))
+            names = set(os.listdir(level_dir)) if os.path.isdir(level_dir) else set()
+            for (column, row) in self.tiles(level):
+                if "%s_%s.%s" % (column, row, format) not in names:
+                    raise ValueError(
+                        "Tile %s_%s of level %s is missing" % (column, row, level)
+                    )
+
+    def _create_tiles_streaming(self):
+        stats = self._stats
+        emit_seconds = [0.0]
+
+        def emit(level, image, rows, y):
+            start = time.perf_counter()
+            columns, num_rows = self.descriptor.get_num_tiles(level)
+            tiles = ((column, row) for row in rows for column in range(columns))
+            self._save_tiles(level, image, tiles, y)
+            if rows[-1] == num_rows - 1:
+                self._complete_level(level)
+            emit_seconds[0] += time.perf_counter() - start
+
+        stream = None
+        for level in range(self.descriptor.num_levels):
+            stream = LevelStream(
+                self.descriptor, level, self.get_resize_filter(), emit, stream
+            )
+        strips = iter_strips(self.image, self.strip_height)
+        if stats is None:
+            for (y, strip) in strips:
+                stream.feed(strip)
+            return
+        for (y, strip) in _timed(strips, stats, "decode"):
+            # Time spent feeding a strip, other than on its tiles, is resizing
+            start = time.perf_counter()
+            emitted = emit_seconds[0]
+            stream.feed(strip)
+            elapsed = time.perf_counter() - start
+            stats.add_time("resize", elapsed - (emit_seconds[0] - emitted))
+
+    def _save_tiles(self, level, image, tiles, y=0, x=0):
+        format = self.descriptor.tile_format
+        grid = self.descriptor.tile_grid(level)
+        if self._pack is None:
+            level_dir = get_or_create_path(os.path.join(self._image_files, str(level)))
+        stats = self._stats
+        for (column, row) in tiles:
+            if self._pack is None:
+                tile_path = os.path.join(level_dir, "%s_%s.%s" % (column, row, format))
+                if self._manifest is not None and os.path.exists(tile_path):
+                    if stats is not None:
+                        stats.count("tiles_skipped")
+                    self._tile_done(level, None)
+                    continue
+            x1, y1, x2, y2 = grid.get_bounds(column, row)
+            if stats is not None:
+                start = time.perf_counter()
+            tile = image.crop((x1 - x, y1 - y, x2 - x, y2 - y))
+            if stats is not None:
+                stats.add_time("crop", time.perf_counter() - start)
+            original = None
+            if self._dedup is not None:
+                if stats is not None:
+                    start = time.perf_counter()
+                key = self._dedup.get_key(tile)
+                original = self._dedup.get(key)
+                if stats is not None:
+                    stats.add_time("hash", time.perf_counter() - start)
+                if original is not None:
+                    # Linked once the original is done
+                    self._executor.after(
+                        functools.partial(
+                            self._duplicate_tile_done,
+                            level,
+                            column,
+                            row,
+                            None if self._pack is not None else tile_path,
+                            original,
+                        )
+                    )
+                    continue
+                # Location and size of the tile, filled in once it is done
+                original = [None, 0]
+                self._dedup.add(key, original)
+            if self._pack is not None:
+                self._executor.submit(
+                    encode_tile_timed,
+                    tile,
+                    format,
+                    self.image_quality,
+                    self._encoder_options,
+                    callback=functools.partial(
+                        self._pack_tile_done, level, column, row, original=original
+                    ),
+                )
+            else:
+                if original is not None:
+                    original[0] = tile_path
+                self._executor.submit(
+                    write_tile,
+                    tile,
+                    tile_path,
+                    format,
+                    self.image_quality,
+                    self._encoder_options,
+                    callback=functools.partial(
+                        self._tile_done, level, original=original
+                    ),
+                )
+
+    def _pack_tile_done(self, level, column, row, result, original=None):
+        data, encode_seconds = result
+        start = time.perf_counter()
+        offset = self._pack.write_tile(level, column, row, data)
+        write_seconds = time.perf_counter() - start
+        if original is not None:
+            original[0] = offset
+        self._tile_done(level, (encode_seconds, write_seconds, len(data)), original)
+
+    def _duplicate_tile_done(self, level, column, row, tile_path, original, _):
+        location, num_bytes = original
+        start = time.perf_counter()
+        if self._pack is not None:
+            self._pack.add_tile(level, column, row, location, num_bytes)
+        else:
+            link_tile(location, tile_path)
+        if self._stats is not None:
+            self._stats.add_time("write", time.perf_counter() - start)
+            self._stats.count("tiles_deduplicated")
+            self._stats.count("bytes_saved", num_bytes)
+        self._tile_done(level, None)
+
+    def _tile_done(self, level, result, original=None):
+        # Called with the result of `write_tile`, or None for a skipped or
+        # deduplicated tile
+        self._tiles_done += 1
+        if original is not None:
+            original[1] = result[2]
+        if result is not None and self._stats is not None:
+            encode_seconds, write_seconds, num_bytes = result
+            self._stats.add_time("encode", encode_seconds)
+            self._stats.add_time("write", write_seconds)
+            self._stats.count("tiles")
+            self._stats.count("bytes", num_bytes)
+        if self._progress is not None:
+            self._progress(level, self._tiles_done, self._tiles_total)
+
+    def _complete_level(self, level):
+        if self._manifest is None and self._stats is None:
+            return
+
+        def complete(_):
+            if self._stats is not None:
+                self._stats.count("levels")
+            if self._manifest is not None:
+                self._manifest.levels.add(level)
+                self._manifest.save(self._manifest_path)
+
+        self._executor.after(complete)
+
+
+def _open_image(source):
+    """Opens a source image, a local or remote file, or returns it if it is
+    already a PIL image."""
+    if isinstance(source, PIL.Image.Image):
+        return source
+    if os.path.exists(source):
+        return PIL.Image.open(source)
+    return PIL.Image.open(safe_open(source))
+
+
+def _get_merge_level(descriptor):
+    """Returns the highest level at most `MERGE_SIZE` pixels wide and high."""
+    level = descriptor.num_levels - 1
+    while level > 0 and max(descriptor.get_dimensions(level)) > MERGE_SIZE:
+        level -= 1
+    return level
+
+
+def _timed(iterator, stats, phase):
+    """Iterator adding the time spent producing every item to a phase."""
+    iterator = iter(iterator)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stats.add_time(phase, time.perf_counter() - start)
+        yield item
+
+
+class _CollectionItemCreator(ImageCreator):
+    """Creates the Deep Zoom image of a collection item, keeping the images of
+    the levels that the collection shows."""
+
+    def __init__(self, max_level, **options):
+        ImageCreator.__init__(self, **options)
+        self.max_level = max_level
+        self.level_images = {}
+
+    def _save_tiles(self, level, image, tiles, y=0, x=0):
+        if (
+            level <= self.max_level
+            and x == 0
+            and y == 0
+            and image.size == self.descriptor.get_dimensions(level)
+        ):
+            self.level_images[level] = image
+        ImageCreator._save_tiles(self, level, image, tiles, y, x)
+
+
+def _is_descriptor(source):
+    """Whether a collection image is a Deep Zoom image rather than a raw image.
+    Local files are parsed as descriptors. URLs, which would have to be fetched,
+    are descriptors unless their path has the extension of an image format."""
+    if source.endswith(PACK_EXTENSION):
+        return True
+    if not os.path.exists(source):
+        extension = os.path.splitext(urlparse(source).path)[1].lower()
+        return extension not in PIL.Image.registered_extensions()
+    descriptor = DeepZoomImageDescriptor()
+    try:
+        with open(source, "rb") as file:
+            descriptor.read(file)
+    except (SyntaxError, ValueError, TypeError):
+        return False
+    return descriptor.width is not None and descriptor.height is not None
+
+
+def _get_item_destination(source, images_path=None):
+    if not os.path.exists(source):
+        source = urlparse(source).path
+    name = os.path.splitext(os.path.basename(source))[0] + ".dzi"
+    if images_path is not None:
+        return os.path.join(images_path, name)
+    if os.path.exists(source):
+        return os.path.splitext(source)[0] + ".dzi"
+    return name
+
+
+def _create_collection_item(
+    image_options, collection_path, max_level, images_path, source, collect_stats
+):
+    """Creates the Deep Zoom image of a raw image, or opens a Deep Zoom image.
+    Returns its path, size, images at the collection levels and stats, as
+    expected by `DeepZoomCollection.save_items`."""
+    stats = BuildStats() if collect_stats else None
+    if _is_descriptor(source):
+        destination = source
+        descriptor = DeepZoomImageDescriptor()
+        descriptor.open(source)
+        images = {}
+    else:
+        destination = _get_item_destination(source, images_path)
+        creator = _CollectionItemCreator(max_level, **image_options)
+        creator.create(source, destination, stats=stats)
+        descriptor = creator.descriptor
+        images = creator.level_images
+    # Such as those of a finished resumable build, which are not built again
+    missing = [
+        level
+        for level in range(min(descriptor.num_levels, max_level + 1))
+        if level not in images
+    ]
+    if missing:
+        collection = DeepZoomCollection(collection_path, max_level=max_level)
+        images.update(collection._get_level_images(destination, missing, descriptor))
+    return (destination, descriptor.width, descriptor.height, images, stats)
 
 
 class CollectionCreator(object):
-    """Creates Deep Zoom collections."""
+    """Creates Deep Zoom collections.
+
+    Images can be Deep Zoom images (DZI) or raw images. The Deep Zoom images of
+    raw images are created with an `ImageCreator` taking `image_options` as
+    keyword arguments, next to their source or in the `images_path` folder.
+    """
 
     def __init__(
         self,
@@ -103,17 +1088,41 @@ class CollectionCreator(object):
         tile_format="jpg",
         copy_metadata=False,
         tile_background_color="#000000",
+        encoder_preset="default",
+        encoder_options=None,
+        dedup=False,
+        image_options=None,
+        images_path=None,
     ):
         self.image_quality = image_quality
         self.tile_size = tile_size
         self.max_level = max_level
         self.tile_format = tile_format
         self.tile_background_color = tile_background_color
+        self.encoder_preset = encoder_preset
+        self.encoder_options = encoder_options
+        self.dedup = dedup
+        self.image_options = image_options or {}
+        self.images_path = images_path
         # TODO
         self.copy_metadata = copy_metadata
 
-    def create(self, images, destination):
-        """Creates a Deep Zoom collection from a list of images."""
+    def create(self, images, destination, workers=1, progress=None, stats=None):
+        """Creates a Deep Zoom collection from a list of images.
+
+        With more than one worker, the collection tiles are rendered on a
+        process pool. See `DeepZoomCollection.save` for `progress` and `stats`.
+
+        If there are raw images, the Deep Zoom images of all images are created
+        or opened on the process pool instead, and the collection tiles are
+        composed in the same pass from the level images in memory, so every
+        source is decoded once and no tile is read back. With lossless item
+        tiles the collection is the same as one created from the Deep Zoom
+        images afterwards; with lossy item tiles it differs by their
+        compression error, which it does not carry. Local files that parse as
+        descriptors are Deep Zoom images, as are URLs whose path does not have
+        the extension of an image format.
+        """
         collection = DeepZoomCollection(
             destination,
             image_quality=self.image_quality,
@@ -121,7 +1130,37 @@ class CollectionCreator(object):
             tile_size=self.tile_size,
             tile_format=self.tile_format,
             tile_background_color=self.tile_background_color,
+            encoder_preset=self.encoder_preset,
+            encoder_options=self.encoder_options,
+            dedup=self.dedup,
+        )
+        images = list(images)
+        if all(_is_descriptor(image) for image in images):
+            collection.extend(images)
+            collection.save(workers=workers, progress=progress, stats=stats)
+            return
+        if self.images_path is not None:
+            get_or_create_path(self.images_path)
+        create_item = functools.partial(
+            _create_collection_item,
+            self.image_options,
+            destination,
+            self.max_level,
+            self.images_path,
+        )
+        collection.save_items(
+            images, create_item, workers=workers, progress=progress, stats=stats
+        )
+
+    async def create_async(
+        self, images, destination, workers=1, progress=None, stats=None, converter=None
+    ):
+        """Awaitable variant of `create` for asyncio code. The conversion runs
+        off the event loop, among a bounded number of conversions at once, and
+        can be cancelled; see `AsyncConverter`. Uses the default converter
+        unless given one."""
+        if converter is None:
+            converter = get_default_converter()
+        await converter.create_collection(
+            self, images, destination, workers=workers, progress=progress, stats=stats
         )
-        for image in images:
-            collection.append(image)
-        collection.save()
\ No newline at end of file
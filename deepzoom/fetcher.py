@@ -0,0 +1,412 @@
+import concurrent.futures
+import hashlib
+import http.client
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from ._cache import LRUCache
+
+
+__all__ = (
+    "DiskCache",
+    "Fetcher",
+    "get_default_fetcher",
+    "set_default_fetcher",
+)
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_REDIRECTS = 5
+USER_AGENT = "deepzoom (Python)"
+
+
+class DiskCache(object):
+    """Content-addressed on-disk cache of fetched resources.
+
+    Every resource is stored once under the digest of its contents, and every
+    key (such as a URL) refers to a digest, so identical resources like blank
+    tiles share storage. When the total size of the stored resources exceeds
+    `max_bytes`, the least recently used ones are evicted. Files are written
+    under temporary names and renamed, so the cache can be shared between
+    processes.
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.size = 0
+        for (_, _, size) in self._iter_objects():
+            self.size += size
+
+    def __getstate__(self):
+        return {"path": self.path, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _get_path(self, kind, digest):
+        return os.path.join(self.path, kind, digest[:2], digest)
+
+    def _iter_objects(self):
+        """Iterator for all stored resources. Returns (path, mtime, size)."""
+        objects_path = os.path.join(self.path, "objects")
+        if not os.path.isdir(objects_path):
+            return
+        for prefix in os.listdir(objects_path):
+            prefix_path = os.path.join(objects_path, prefix)
+            for name in os.listdir(prefix_path):
+                if name.endswith(".part"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(prefix_path, name))
+                except OSError:
+                    continue
+                yield (os.path.join(prefix_path, name), stat.st_mtime, stat.st_size)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = "%s.%s.%s.part" % (path, os.getpid(), threading.get_ident())
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def get(self, key):
+        """Returns the resource stored under a key, or None."""
+        key_path = self._get_path("keys", hashlib.sha1(key.encode("UTF-8")).hexdigest())
+        try:
+            with open(key_path, "r") as file:
+                digest = file.read()
+            object_path = self._get_path("objects", digest)
+            with open(object_path, "rb") as file:
+                data = file.read()
+        except (IOError, OSError):
+            return None
+        if hashlib.sha1(data).hexdigest() != digest:
+            return None
+        # Mark as recently used
+        os.utime(object_path)
+        return data
+
+    def put(self, key, data):
+        """Stores a resource under a key."""
+        if len(data) > self.max_bytes:
+            return
+        digest = hashlib.sha1(data).hexdigest()
+        object_path = self._get_path("objects", digest)
+        if not os.path.exists(object_path):
+            self._write(object_path, data)
+            with self._lock:
+                self.size += len(data)
+        else:
+            os.utime(object_path)
+        key_path = self._get_path("keys", hashlib.sha1(key.encode("UTF-8")).hexdigest())
+        self._write(key_path, digest.encode("ascii"))
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used resources until the cache is at most
+        90% full, leaving room for new resources before the next eviction."""
+        with self._lock:
+            objects = sorted(self._iter_objects(), key=lambda entry: entry[1])
+            self.size = sum(size for (_, _, size) in objects)
+            target = self.max_bytes * 0.9
+            for (path, _, size) in objects:
+                if self.size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                # Keys referring to removed resources are treated as misses
+                self.size -= size
+
+    def clear(self):
+        with self._lock:
+            for (path, _, _) in list(self._iter_objects()):
+                os.remove(path)
+            self.size = 0
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP(S) connections, reused per host."""
+
+    def __init__(self, max_idle=8, timeout=30):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def acquire(self, scheme, netloc):
+        """Returns (connection, reused)."""
+        with self._lock:
+            # Connections must not be shared with forked processes
+            if self._pid != os.getpid():
+                self._idle = {}
+                self._pid = os.getpid()
+            idle = self._idle.get((scheme, netloc))
+            if idle:
+                return (idle.pop(), True)
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+        return (connection, False)
+
+    def release(self, scheme, netloc, connection):
+        with self._lock:
+            if self._pid == os.getpid():
+                idle = self._idle.setdefault((scheme, netloc), [])
+                if len(idle) < self.max_idle:
+                    idle.append(connection)
+                    return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for connection in idle:
+                    connection.close()
+            self._idle = {}
+
+
+class Fetcher(object):
+    """Fetches remote resources over keep-alive connections, retrying failed
+    requests, on a pool of `workers` threads.
+
+    Resources are not cached unless `max_memory_bytes` allows a memory cache
+    of that size or a `DiskCache` is given as `cache`, as cached resources are
+    assumed never to change. Prefetched resources are kept until they are
+    fetched, and fetches of a URL being prefetched wait for it. Requests go
+    through the proxy configured for their scheme, such as by `https_proxy`,
+    if any, and otherwise over pooled connections.
+    """
+
+    def __init__(
+        self,
+        workers=8,
+        retries=3,
+        retry_delay=0.5,
+        timeout=30,
+        cache=None,
+        max_memory_bytes=0,
+    ):
+        self.workers = max(int(workers), 1)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.cache = cache
+        self.memory = LRUCache(max_bytes=max_memory_bytes)
+        self.max_memory_bytes = max_memory_bytes
+        self._connections = ConnectionPool(self.workers, timeout)
+        self._pool = None
+        self._pending = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Connections, threads and the memory cache are not shared with other
+        # processes
+        return {
+            "workers": self.workers,
+            "retries": self.retries,
+            "retry_delay": self.retry_delay,
+            "timeout": self.timeout,
+            "cache": self.cache,
+            "max_memory_bytes": self.max_memory_bytes,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def fetch(self, url):
+        """Returns the contents of a URL as bytes. Raises `IOError` if it cannot
+        be fetched."""
+        future = self._pop_pending(url)
+        if future is not None:
+            return future.result()
+        return self._fetch_cached(url)
+
+    def fetch_many(self, urls):
+        """Iterator for the contents of the given URLs, fetched concurrently.
+        Returns (url, data), in order. `data` is the exception instead if a URL
+        cannot be fetched."""
+        futures = [(url, self.prefetch(url)) for url in urls]
+        for (url, future) in futures:
+            try:
+                yield (url, future.result())
+            except IOError as e:
+                yield (url, e)
+            finally:
+                self._pop_pending(url, future)
+
+    def prefetch(self, url):
+        """Starts fetching a URL in the background, so that the next `fetch` of
+        it returns the result. Returns a `concurrent.futures.Future`."""
+        with self._lock:
+            future = self._pending.get(url)
+            if future is not None:
+                return future
+            future = self._get_pool().submit(self._fetch_cached, url)
+            self._pending[url] = future
+            return future
+
+    def map(self, fn, iterable):
+        """Like the built-in `map`, but runs `fn` concurrently on the fetcher
+        threads, such as for fetching and parsing many descriptors."""
+        with self._lock:
+            pool = self._get_pool()
+        return pool.map(fn, iterable)
+
+    def _get_pool(self):
+        # Threads do not survive forking, so forked processes start their own
+        if self._pid != os.getpid():
+            self._pool = None
+            self._pending = {}
+            self._pid = os.getpid()
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        return self._pool
+
+    def _pop_pending(self, url, future=None):
+        """Removes and returns the prefetch of a URL, if any, or only the given
+        one."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return None
+            pending = self._pending.get(url)
+            if pending is None or (future is not None and pending is not future):
+                return None
+            return self._pending.pop(url)
+
+    def _fetch_cached(self, url):
+        data = None
+        if self.max_memory_bytes:
+            data = self.memory.get(url)
+            if data is not None:
+                return data
+        if self.cache is not None:
+            data = self.cache.get(url)
+        if data is None:
+            data = self._fetch(url)
+            if self.cache is not None:
+                self.cache.put(url, data)
+        if self.max_memory_bytes:
+            self.memory.put(url, data)
+        return data
+
+    def _fetch(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https"):
+            return urllib.request.urlopen(url, timeout=self.timeout).read()
+        attempt = 0
+        redirects = 0
+        while True:
+            try:
+                status, headers, data = self._request(url)
+            except (IOError, http.client.HTTPException) as e:
+                if attempt >= self.retries:
+                    if isinstance(e, IOError):
+                        raise
+                    raise urllib.error.URLError(e)
+            else:
+                if status in REDIRECT_STATUSES and "Location" in headers:
+                    redirects += 1
+                    if redirects > MAX_REDIRECTS:
+                        raise urllib.error.HTTPError(
+                            url, status, "Too many redirects", headers, None
+                        )
+                    url = urllib.parse.urljoin(url, headers["Location"])
+                    continue
+                if status == 200:
+                    return data
+                if status not in RETRY_STATUSES or attempt >= self.retries:
+                    raise urllib.error.HTTPError(
+                        url, status, http.client.responses.get(status, ""), headers, None
+                    )
+            time.sleep(self.retry_delay * (2 ** attempt))
+            attempt += 1
+
+    def _request(self, url):
+        """Sends a GET request over a pooled connection. Returns (status,
+        headers, body)."""
+        parsed = urllib.parse.urlsplit(url)
+        if urllib.request.getproxies().get(parsed.scheme) and not (
+            urllib.request.proxy_bypass(parsed.hostname or "")
+        ):
+            return self._request_proxied(url)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        while True:
+            connection, reused = self._connections.acquire(
+                parsed.scheme, parsed.netloc
+            )
+            try:
+                connection.request("GET", path, headers={"User-Agent": USER_AGENT})
+                response = connection.getresponse()
+                data = response.read()
+            except (IOError, http.client.HTTPException):
+                connection.close()
+                # The server may have closed an idle connection
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._connections.release(parsed.scheme, parsed.netloc, connection)
+            return (response.status, response.headers, data)
+
+    def _request_proxied(self, url):
+        """Sends a GET request through the configured proxy, which `urllib`
+        supports but pooled connections do not. Returns (status, headers,
+        body)."""
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return (response.status, response.headers, response.read())
+        except urllib.error.HTTPError as e:
+            e.close()
+            return (e.code, e.headers, None)
+
+    def close(self):
+        """Closes all connections and stops the fetcher threads."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+        self._connections.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_default_fetcher():
+    """Returns the fetcher used for opening remote sources."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher()
+        return _default_fetcher
+
+
+def set_default_fetcher(fetcher):
+    """Sets the fetcher used for opening remote sources, such as one with a
+    memory cache, a `DiskCache` or more workers."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        _default_fetcher = fetcher
@@ -0,0 +1,249 @@
+import io
+import os
+import time
+
+import PIL.Image
+
+from ._defaults import IMAGE_FORMATS, DEFAULT_IMAGE_FORMAT, PACK_EXTENSION
+from ._encoder import get_encoder_options, write_tile
+from ._executor import BoundedExecutor
+from ._image_descriptor import DeepZoomImageDescriptor
+from ._utils import clamp, get_files_path, get_or_create_path, is_remote, open_stream
+from .fetcher import get_default_fetcher
+from .stats import BuildStats
+from .tile_pack import TilePackReader
+
+
+__all__ = ("retile",)
+
+
+def retile(
+    source,
+    destination,
+    tile_size=None,
+    tile_overlap=None,
+    tile_format=None,
+    image_quality=0.8,
+    encoder_preset="default",
+    encoder_options=None,
+    workers=1,
+    progress=None,
+    stats=None,
+):
+    """Re-tiles a Deep Zoom image with a new tile size, overlap or format,
+    reading its tiles instead of the original image.
+
+    `source` is a local or remote descriptor (DZI) or a tile pack. Settings
+    left as None are kept from the source. Every level is reassembled one row
+    of destination tiles at a time, holding only the rows of source tiles that
+    it overlaps, so memory is bounded by the level width times a few tile
+    heights. With more than one worker, levels, and bands of rows of the larger
+    levels, are re-tiled on a process pool. Tiles are decoded and encoded
+    again, so lossy formats lose some quality.
+
+    `progress` is called with (level, tiles_done, tiles_total) whenever a
+    band is done, as by `ImageCreator.create`. A `BuildStats` passed as `stats` collects the time spent decoding
+    source tiles, composing, encoding and writing tiles, and counts tiles and
+    bytes written.
+    """
+    if os.path.abspath(source) == os.path.abspath(destination):
+        raise ValueError("Cannot re-tile a Deep Zoom image onto itself: %s" % source)
+    descriptor = DeepZoomImageDescriptor()
+    descriptor.open(source)
+    if tile_format is None:
+        tile_format = descriptor.tile_format
+    if not tile_format in IMAGE_FORMATS:
+        tile_format = DEFAULT_IMAGE_FORMAT
+    target = DeepZoomImageDescriptor(
+        width=descriptor.width,
+        height=descriptor.height,
+        tile_size=descriptor.tile_size if tile_size is None else int(tile_size),
+        tile_overlap=descriptor.tile_overlap
+        if tile_overlap is None
+        else clamp(int(tile_overlap), 0, 10),
+        tile_format=tile_format,
+    )
+    arguments = {
+        "source": source,
+        "descriptor": descriptor,
+        "files_path": get_or_create_path(get_files_path(destination)),
+        "target": target,
+        "image_quality": clamp(image_quality, 0, 1.0),
+        "encoder_options": get_encoder_options(
+            tile_format, encoder_preset, encoder_options
+        ),
+    }
+    units = _get_work_units(target, workers)
+    tiles_total = sum(
+        len(rows) * target.get_num_tiles(level)[0] for (level, rows) in units
+    )
+    tiles_done = [0]
+
+    def done(level):
+        def callback(result):
+            num_tiles, unit_stats = result
+            tiles_done[0] += num_tiles
+            if unit_stats is not None:
+                stats.update(unit_stats)
+            if progress is not None:
+                progress(level, tiles_done[0], tiles_total)
+
+        return callback
+
+    with BoundedExecutor(workers, processes=True) as executor:
+        for (level, rows) in units:
+            executor.submit(
+                _retile_rows,
+                arguments,
+                level,
+                rows,
+                stats is not None,
+                callback=done(level),
+            )
+    target.save(destination)
+
+
+def _get_work_units(descriptor, workers):
+    """Splits the tiles of every level into bands of rows, so that the larger
+    levels keep all workers busy. Returns a list of (level, rows), from the
+    highest level down."""
+    levels = list(reversed(range(descriptor.num_levels)))
+    if workers <= 1:
+        return [(level, range(descriptor.get_num_tiles(level)[1])) for level in levels]
+    total = sum(len(descriptor.tile_grid(level)) for level in levels)
+    tiles_per_unit = max(total // (workers * 4), 1)
+    units = []
+    for level in levels:
+        columns, rows = descriptor.get_num_tiles(level)
+        rows_per_unit = max(tiles_per_unit // columns, 1)
+        for first in range(0, rows, rows_per_unit):
+            units.append((level, range(first, min(first + rows_per_unit, rows))))
+    return units
+
+
+def _retile_rows(arguments, level, rows, collect_stats):
+    """Writes the given rows of destination tiles of a level. Returns (tiles
+    written, stats)."""
+    stats = BuildStats() if collect_stats else None
+    reader = _TileReader(arguments["source"], arguments["descriptor"])
+    try:
+        target = arguments["target"]
+        grid = target.tile_grid(level)
+        width = target.get_dimensions(level)[0]
+        source_size = arguments["descriptor"].tile_size
+        level_path = get_or_create_path(
+            os.path.join(arguments["files_path"], str(level))
+        )
+        strips = {}
+        num_tiles = 0
+        for row in rows:
+            y1, y2 = grid.y1[row], grid.y2[row]
+            first, last = y1 // source_size, (y2 - 1) // source_size
+            for source_row in [key for key in strips if key < first]:
+                del strips[source_row]
+            if stats is not None:
+                start = time.perf_counter()
+            for source_row in range(first, last + 1):
+                if source_row not in strips:
+                    strips[source_row] = reader.read_strip(level, source_row)
+            if stats is not None:
+                composed = time.perf_counter()
+                stats.add_time("decode", composed - start)
+            band = None
+            for source_row in range(first, last + 1):
+                strip = strips[source_row]
+                if band is None:
+                    band = PIL.Image.new(strip.mode, (width, y2 - y1))
+                band.paste(strip, (0, source_row * source_size - y1))
+            if stats is not None:
+                stats.add_time("compose", time.perf_counter() - composed)
+            for column in range(grid.columns):
+                if stats is not None:
+                    start = time.perf_counter()
+                tile = band.crop((grid.x1[column], 0, grid.x2[column], y2 - y1))
+                if stats is not None:
+                    stats.add_time("compose", time.perf_counter() - start)
+                tile_path = os.path.join(
+                    level_path, "%s_%s.%s" % (column, row, target.tile_format)
+                )
+                result = write_tile(
+                    tile,
+                    tile_path,
+                    target.tile_format,
+                    arguments["image_quality"],
+                    arguments["encoder_options"],
+                )
+                num_tiles += 1
+                if stats is not None:
+                    encode_seconds, write_seconds, num_bytes = result
+                    stats.add_time("encode", encode_seconds)
+                    stats.add_time("write", write_seconds)
+                    stats.count("tiles")
+                    stats.count("bytes", num_bytes)
+    finally:
+        reader.close()
+    return (num_tiles, stats)
+
+
+class _TileReader(object):
+    """Reads the tiles of a local or remote Deep Zoom image or of a tile pack."""
+
+    def __init__(self, source, descriptor):
+        self.source = source
+        self.descriptor = descriptor
+        self._pack = None
+        if source.endswith(PACK_EXTENSION):
+            self._pack = TilePackReader(source)
+        self._remote = is_remote(source)
+
+    def get_tile_path(self, level, column, row):
+        return "%s/%s/%s_%s.%s" % (
+            get_files_path(self.source),
+            level,
+            column,
+            row,
+            self.descriptor.tile_format,
+        )
+
+    def open_tile(self, level, column, row):
+        if self._pack is not None:
+            tile = self._pack.get_tile(level, column, row)
+            try:
+                return io.BytesIO(tile)
+            finally:
+                tile.release()
+        return open_stream(self.get_tile_path(level, column, row))
+
+    def read_strip(self, level, row):
+        """Returns a row of tiles of a level, without their overlap, as one
+        image as wide as the level."""
+        grid = self.descriptor.tile_grid(level)
+        width, height = self.descriptor.get_dimensions(level)
+        size = self.descriptor.tile_size
+        if self._remote and row + 1 < grid.rows:
+            # The next row is fetched while this one is decoded
+            fetcher = get_default_fetcher()
+            for column in range(grid.columns):
+                fetcher.prefetch(self.get_tile_path(level, column, row + 1))
+        top = row * size
+        strip = None
+        for column in range(grid.columns):
+            with self.open_tile(level, column, row) as file:
+                tile = PIL.Image.open(file)
+                tile.load()
+            if strip is None:
+                strip = PIL.Image.new(tile.mode, (width, min(size, height - top)))
+            elif tile.mode != strip.mode:
+                tile = tile.convert(strip.mode)
+            left = column * size
+            x = left - grid.x1[column]
+            y = top - grid.y1[row]
+            interior = tile.crop(
+                (x, y, x + min(size, width - left), y + strip.size[1])
+            )
+            strip.paste(interior, (left, 0))
+        return strip
+
+    def close(self):
+        if self._pack is not None:
+            self._pack.close()
@@ -0,0 +1,58 @@
+from contextlib import contextmanager
+import time
+
+
+__all__ = ("BuildStats",)
+
+
+class BuildStats(object):
+    """Cumulative timings of the phases of a build, in seconds, and counters,
+    such as tiles and bytes written.
+
+    Pass an instance to `ImageCreator.create`, `CollectionCreator.create` or
+    `DeepZoomCollection.save` to collect them. Subclasses can override
+    `add_time` and `count` to forward measurements elsewhere as they happen.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, phase):
+        """Context manager adding the time spent in it to a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def update(self, other):
+        """Adds the timings and counters of other stats, such as those collected
+        by a worker process."""
+        for (phase, seconds) in other.timings.items():
+            self.add_time(phase, seconds)
+        for (name, value) in other.counters.items():
+            self.count(name, value)
+
+    def to_dict(self):
+        return {"timings": dict(self.timings), "counters": dict(self.counters)}
+
+    def format(self):
+        """Returns the stats as a table, one phase or counter per line."""
+        lines = []
+        total = sum(self.timings.values())
+        for (phase, seconds) in sorted(
+            self.timings.items(), key=lambda item: -item[1]
+        ):
+            share = seconds / total * 100 if total else 0
+            lines.append("%-20s %10.3fs %5.1f%%" % (phase, seconds, share))
+        for (name, value) in sorted(self.counters.items()):
+            lines.append("%-20s %11d" % (name, value))
+        return "\n".join(lines)
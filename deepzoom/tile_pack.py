@@ -0,0 +1,216 @@
+import io
+import mmap
+import os
+import struct
+
+from ._image_descriptor import DeepZoomImageDescriptor
+from ._utils import get_files_path, get_or_create_path
+
+
+__all__ = (
+    "TilePackReader",
+    "TilePackWriter",
+    "pack_tiles",
+    "unpack_tiles",
+)
+
+PACK_MAGIC = b"DZTP"
+PACK_VERSION = 1
+
+# magic, version, reserved, index offset, tile count, descriptor offset and length
+HEADER = struct.Struct("<4sHHQQQQ")
+# level, column, row, offset, length
+INDEX_ENTRY = struct.Struct("<IIIQI")
+
+
+class TilePackWriter(object):
+    """Writes tiles back-to-back into a single pack file.
+
+    The file starts with a fixed-size header, followed by the encoded tiles,
+    the descriptor (DZI) XML and an index of (level, column, row) to (offset,
+    length) sorted by position. Identical tiles can share their bytes.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Written under a temporary name until closed
+        self._file = open(filename + ".part", "wb")
+        self._file.write(b"\0" * HEADER.size)
+        self._offset = HEADER.size
+        self._index = []
+
+    def write_tile(self, level, column, row, data):
+        """Appends an encoded tile. Returns its offset."""
+        offset = self._offset
+        self._file.write(data)
+        self._index.append((level, column, row, offset, len(data)))
+        self._offset += len(data)
+        return offset
+
+    def add_tile(self, level, column, row, offset, length):
+        """Adds a tile sharing the bytes of a tile already written at the given
+        offset."""
+        self._index.append((level, column, row, offset, length))
+
+    def close(self, descriptor):
+        """Writes descriptor and index and closes the file."""
+        xml = descriptor.to_xml()
+        descriptor_offset = self._offset
+        self._file.write(xml)
+        index_offset = descriptor_offset + len(xml)
+        self._index.sort()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.seek(0)
+        self._file.write(
+            HEADER.pack(
+                PACK_MAGIC,
+                PACK_VERSION,
+                0,
+                index_offset,
+                len(self._index),
+                descriptor_offset,
+                len(xml),
+            )
+        )
+        self._file.close()
+        os.replace(self.filename + ".part", self.filename)
+
+    def abort(self):
+        """Closes and removes an unfinished pack file."""
+        self._file.close()
+        os.remove(self.filename + ".part")
+
+
+class TilePackReader(object):
+    """Reads tiles from a pack file through a memory map.
+
+    `get_tile` returns a zero-copy `memoryview` of the tile bytes. Views must
+    be released before the reader is closed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map.size() < HEADER.size:
+            raise IOError("Invalid tile pack: %s" % filename)
+        (
+            magic,
+            version,
+            _,
+            self._index_offset,
+            self._count,
+            descriptor_offset,
+            descriptor_length,
+        ) = HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self._map.close()
+            raise IOError("Invalid tile pack: %s" % filename)
+        self.descriptor_xml = self._map[
+            descriptor_offset : descriptor_offset + descriptor_length
+        ]
+        self.descriptor = DeepZoomImageDescriptor()
+        self.descriptor.read(io.BytesIO(self.descriptor_xml))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self._find(*key) is not None
+
+    def __iter__(self):
+        """Iterator for all tiles. Returns (level, column, row) of a tile."""
+        for i in range(self._count):
+            yield self._get_entry(i)[:3]
+
+    def _get_entry(self, i):
+        return INDEX_ENTRY.unpack_from(
+            self._map, self._index_offset + i * INDEX_ENTRY.size
+        )
+
+    def _find(self, level, column, row):
+        key = (level, column, row)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._get_entry(middle)
+            if entry[:3] < key:
+                low = middle + 1
+            elif entry[:3] > key:
+                high = middle
+            else:
+                return entry
+        return None
+
+    def get_descriptor(self):
+        """Returns the descriptor (DZI) as UTF-8 encoded XML."""
+        return self.descriptor_xml
+
+    def get_tile(self, level, column, row):
+        """Returns a view of the encoded tile at the given position."""
+        entry = self._find(level, column, row)
+        if entry is None:
+            raise KeyError("Tile not in pack: %s/%s_%s" % (level, column, row))
+        offset, length = entry[3:]
+        return memoryview(self._map)[offset : offset + length]
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def pack_tiles(source, destination):
+    """Packs the tiles folder of a local Deep Zoom image into a pack file."""
+    descriptor = DeepZoomImageDescriptor()
+    descriptor.open(source)
+    files_path = get_files_path(source)
+    writer = TilePackWriter(destination)
+    # Hard-linked tiles, as written in dedup mode, share their bytes
+    linked = {}
+    try:
+        for level in range(descriptor.num_levels):
+            columns, rows = descriptor.get_num_tiles(level)
+            for column in range(columns):
+                for row in range(rows):
+                    tile_path = os.path.join(
+                        files_path,
+                        str(level),
+                        "%s_%s.%s" % (column, row, descriptor.tile_format),
+                    )
+                    stat = os.stat(tile_path)
+                    inode = (stat.st_dev, stat.st_ino) if stat.st_nlink > 1 else None
+                    if inode in linked:
+                        writer.add_tile(level, column, row, *linked[inode])
+                        continue
+                    with open(tile_path, "rb") as file:
+                        data = file.read()
+                    offset = writer.write_tile(level, column, row, data)
+                    if inode is not None:
+                        linked[inode] = (offset, len(data))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close(descriptor)
+
+
+def unpack_tiles(source, destination):
+    """Unpacks a pack file into a Deep Zoom image with a tiles folder."""
+    with TilePackReader(source) as reader:
+        descriptor = reader.descriptor
+        files_path = get_files_path(destination)
+        for (level, column, row) in reader:
+            level_dir = get_or_create_path(os.path.join(files_path, str(level)))
+            tile_path = os.path.join(
+                level_dir, "%s_%s.%s" % (column, row, descriptor.tile_format)
+            )
+            tile = reader.get_tile(level, column, row)
+            with open(tile_path, "wb") as file:
+                file.write(tile)
+            tile.release()
+    descriptor.save(destination)
@@ -0,0 +1,228 @@
+import math
+import re
+import threading
+
+import PIL.Image
+
+from ._cache import LRUCache
+from ._defaults import IMAGE_FORMATS, DEFAULT_IMAGE_FORMAT, RESIZE_FILTERS
+from ._encoder import encode_tile, get_encoder_options
+from ._image_descriptor import DeepZoomImageDescriptor
+from ._streaming import FILTER_MARGIN
+from ._utils import clamp, safe_open
+
+
+__all__ = (
+    "DeepZoomTileSource",
+    "DeepZoomWSGIApplication",
+)
+
+
+def _image_size(image):
+    width, height = image.size
+    return width * height * len(image.getbands())
+
+
+class DeepZoomTileSource(object):
+    """Renders Deep Zoom tiles on demand from a source image.
+
+    Encoded tiles and level images are kept in least-recently-used caches that
+    are bounded by number of entries and by size in bytes. Tiles of levels too
+    large for the level cache are rendered from the matching region of the
+    level above instead.
+    """
+
+    def __init__(
+        self,
+        source,
+        tile_size=254,
+        tile_overlap=1,
+        tile_format="jpg",
+        image_quality=0.8,
+        resize_filter=None,
+        max_tiles=4096,
+        max_tile_bytes=64 * 1024 * 1024,
+        max_levels=8,
+        max_level_bytes=256 * 1024 * 1024,
+        encoder_preset="default",
+        encoder_options=None,
+    ):
+        if isinstance(source, PIL.Image.Image):
+            self.image = source
+        else:
+            self.image = PIL.Image.open(safe_open(source))
+        self.image.load()
+        if not tile_format in IMAGE_FORMATS:
+            tile_format = DEFAULT_IMAGE_FORMAT
+        self.image_quality = clamp(image_quality, 0, 1.0)
+        self.encoder_options = get_encoder_options(
+            tile_format, encoder_preset, encoder_options
+        )
+        self.resize_filter = RESIZE_FILTERS.get(
+            resize_filter, PIL.Image.Resampling.LANCZOS
+        )
+        width, height = self.image.size
+        self.descriptor = DeepZoomImageDescriptor(
+            width=width,
+            height=height,
+            tile_size=int(tile_size),
+            tile_overlap=clamp(int(tile_overlap), 0, 10),
+            tile_format=tile_format,
+        )
+        self.tiles = LRUCache(max_tiles, max_tile_bytes)
+        self.levels = LRUCache(max_levels, max_level_bytes, sizeof=_image_size)
+        self._level_lock = threading.Lock()
+
+    def get_descriptor(self):
+        """Returns the descriptor (DZI) as UTF-8 encoded XML."""
+        return self.descriptor.to_xml()
+
+    def get_level_image(self, level):
+        """Returns the bitmap image at the given level.
+
+        Like `ImageCreator` in cascade mode, every level is produced by halving
+        the level above it, starting from the nearest cached level, so tiles
+        match its output no matter what is cached.
+        """
+        assert 0 <= level < self.descriptor.num_levels, "Invalid pyramid level"
+        max_level = self.descriptor.num_levels - 1
+        if level == max_level:
+            return self.image
+        image = self.levels.get(level)
+        if image is not None:
+            return image
+        with self._level_lock:
+            larger = level + 1
+            image = self.levels.get(larger) if larger < max_level else self.image
+            while image is None:
+                larger += 1
+                image = self.levels.get(larger) if larger < max_level else self.image
+            for smaller in reversed(range(level, larger)):
+                size = self.descriptor.get_dimensions(smaller)
+                image = image.resize(size, self.resize_filter)
+                self.levels.put(smaller, image)
+        return image
+
+    def get_level_region(self, level, box):
+        """Returns the given box of the bitmap image at the given level.
+
+        Levels too large for the level cache would be resized as a whole on
+        every call, so their regions are resized from the matching region of
+        the level above, plus the margin the resize filter reads.
+        """
+        max_level = self.descriptor.num_levels - 1
+        width, height = self.descriptor.get_dimensions(level)
+        max_bytes = self.levels.max_bytes
+        if (
+            level == max_level
+            or max_bytes is None
+            or width * height * len(self.image.getbands()) <= max_bytes
+        ):
+            return self.get_level_image(level).crop(box)
+        x1, y1, x2, y2 = box
+        width_above, height_above = self.descriptor.get_dimensions(level + 1)
+        scale_x = width_above / width
+        scale_y = height_above / height
+        above = (
+            max(int(math.floor(x1 * scale_x)) - FILTER_MARGIN, 0),
+            max(int(math.floor(y1 * scale_y)) - FILTER_MARGIN, 0),
+            min(int(math.ceil(x2 * scale_x)) + FILTER_MARGIN, width_above),
+            min(int(math.ceil(y2 * scale_y)) + FILTER_MARGIN, height_above),
+        )
+        region = self.get_level_region(level + 1, above)
+        return region.resize(
+            (x2 - x1, y2 - y1),
+            self.resize_filter,
+            box=(
+                x1 * scale_x - above[0],
+                y1 * scale_y - above[1],
+                x2 * scale_x - above[0],
+                y2 * scale_y - above[1],
+            ),
+        )
+
+    def get_tile(self, level, column, row):
+        """Returns the encoded tile at the given position."""
+        if not 0 <= level < self.descriptor.num_levels:
+            raise ValueError("Invalid pyramid level: %s" % level)
+        columns, rows = self.descriptor.get_num_tiles(level)
+        if not (0 <= column < columns and 0 <= row < rows):
+            raise ValueError("Invalid tile: %s/%s_%s" % (level, column, row))
+        key = (level, column, row)
+        data = self.tiles.get(key)
+        if data is None:
+            bounds = self.descriptor.get_tile_bounds(level, column, row)
+            tile = self.get_level_region(level, bounds)
+            data = encode_tile(
+                tile,
+                self.descriptor.tile_format,
+                self.image_quality,
+                self.encoder_options,
+            )
+            self.tiles.put(key, data)
+        return data
+
+
+class DeepZoomWSGIApplication(object):
+    """WSGI application serving tile sources, such as `DeepZoomTileSource` or
+    `TilePackReader`, by name.
+
+    `GET /<name>.dzi` returns the descriptor and
+    `GET /<name>_files/<level>/<column>_<row>.<format>` returns a tile.
+    """
+
+    CONTENT_TYPES = {
+        "dzi": "application/xml",
+        "jpg": "image/jpeg",
+        "png": "image/png",
+        "webp": "image/webp",
+        "avif": "image/avif",
+    }
+
+    PATH_PATTERN = re.compile(
+        r"^/(?P<name>.+?)(?:\.(?P<dzi>dzi)|_files/(?P<level>\d+)/"
+        r"(?P<column>\d+)_(?P<row>\d+)\.(?P<format>\w+))$"
+    )
+
+    def __init__(self, sources):
+        self.sources = dict(sources)
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD", "GET") not in ("GET", "HEAD"):
+            return self._respond(start_response, "405 Method Not Allowed")
+        match = self.PATH_PATTERN.match(environ.get("PATH_INFO", ""))
+        source = self.sources.get(match.group("name")) if match else None
+        if source is None:
+            return self._respond(start_response, "404 Not Found")
+        if match.group("dzi"):
+            body = source.get_descriptor()
+            content_type = self.CONTENT_TYPES["dzi"]
+        else:
+            if match.group("format") != source.descriptor.tile_format:
+                return self._respond(start_response, "404 Not Found")
+            try:
+                body = bytes(
+                    source.get_tile(
+                        int(match.group("level")),
+                        int(match.group("column")),
+                        int(match.group("row")),
+                    )
+                )
+            except (KeyError, ValueError):
+                return self._respond(start_response, "404 Not Found")
+            content_type = self.CONTENT_TYPES[source.descriptor.tile_format]
+        if environ.get("REQUEST_METHOD") == "HEAD":
+            return self._respond(start_response, "200 OK", content_type, b"", len(body))
+        return self._respond(start_response, "200 OK", content_type, body)
+
+    def _respond(
+        self, start_response, status, content_type="text/plain", body=None, length=None
+    ):
+        if body is None:
+            body = status.encode("UTF-8")
+        headers = [
+            ("Content-Type", content_type),
+            ("Content-Length", str(len(body) if length is None else length)),
+        ]
+        start_response(status, headers)
+        return [body]
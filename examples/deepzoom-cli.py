@@ -1,41 +1,246 @@
+import glob
 import os
+import subprocess
 import sys
-from deepzoom import ImageCreator
-from deepzoom._defaults import DEFAULT_IMAGE_FORMAT, DEFAULT_RESIZE_FILTER, RESIZE_FILTERS
+import time
+from deepzoom import BuildStats, CollectionCreator, ImageCreator, retile
+from deepzoom._defaults import (
+    IMAGE_FORMATS,
+    PACK_EXTENSION,
+    RESIZE_FILTERS,
+)
+from deepzoom._executor import BoundedExecutor
 
 import optparse
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".ppm", ".gif")
+
+
+def get_sources(args, file_list=None, destination=None):
+    """Returns (source, destination name) for every image given as a file, a
+    directory (searched recursively) or a glob, and in a file list.
+
+    Directories skip the output of earlier runs: tiles folders, shards folders
+    and the `destination` directory."""
+    sources = []
+    destination = os.path.realpath(destination) if destination else None
+    for arg in args:
+        if os.path.isdir(arg):
+            for (path, dirnames, names) in os.walk(arg):
+                dirnames[:] = sorted(
+                    name
+                    for name in dirnames
+                    if not name.endswith(("_files", "_shards"))
+                    and os.path.realpath(os.path.join(path, name)) != destination
+                )
+                for name in sorted(names):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        source = os.path.join(path, name)
+                        sources.append((source, os.path.relpath(source, arg)))
+        elif glob.has_magic(arg):
+            for source in sorted(glob.glob(arg)):
+                sources.append((source, os.path.basename(source)))
+        else:
+            sources.append((arg, os.path.basename(arg)))
+    if file_list:
+        file = sys.stdin if file_list == "-" else open(file_list)
+        for line in file:
+            source = line.strip()
+            if source:
+                sources.append((source, os.path.basename(source)))
+    return sources
+
+
+def convert(creator_options, source, destination, profile=False):
+    """Converts one image in batch mode. Returns (status, tiles, bytes read
+    from a local source, stats), where status is "created", "skipped" or an
+    error message."""
+    creator = ImageCreator(resumable=True, **creator_options)
+    if creator.is_up_to_date(source, destination):
+        return ("skipped", 0, 0, None)
+    stats = BuildStats() if profile else None
+    try:
+        destination_dir = os.path.dirname(destination)
+        if destination_dir and not os.path.exists(destination_dir):
+            os.makedirs(destination_dir, exist_ok=True)
+        creator.create(source, destination, stats=stats)
+        # Only local sources are counted, URLs have no size to read
+        num_bytes = os.path.getsize(source) if os.path.isfile(source) else 0
+    except Exception as e:
+        return ("%s: %s" % (type(e).__name__, e), 0, 0, None)
+    num_tiles = 0
+    for level in range(creator.descriptor.num_levels):
+        columns, rows = creator.descriptor.get_num_tiles(level)
+        num_tiles += columns * rows
+    return ("created", num_tiles, num_bytes, stats)
+
+
+def print_stats(stats):
+    sys.stderr.write(stats.format() + "\n")
+
+
+def print_progress(level, tiles_done, tiles_total):
+    if level is None:
+        sys.stderr.write("\r%d/%d tiles" % (tiles_done, tiles_total))
+    else:
+        sys.stderr.write(
+            "\rLevel %2d: %d/%d tiles" % (level, tiles_done, tiles_total)
+        )
+    if tiles_done == tiles_total:
+        sys.stderr.write("\n")
+
+
+def run_batch(sources, options, creator_options):
+    """Converts many images on a process pool and prints throughput stats."""
+    totals = {"created": 0, "skipped": 0, "failed": 0, "tiles": 0, "bytes": 0}
+    stats = BuildStats() if options.profile else None
+    destinations = []
+    start = time.time()
+
+    def done(source, destination):
+        def callback(result):
+            status, num_tiles, num_bytes, image_stats = result
+            if image_stats is not None:
+                stats.update(image_stats)
+            if status in ("created", "skipped"):
+                totals[status] += 1
+                destinations.append(destination)
+            else:
+                totals["failed"] += 1
+                sys.stderr.write("Failed: %s (%s)\n" % (source, status))
+            totals["tiles"] += num_tiles
+            totals["bytes"] += num_bytes
+
+        return callback
+
+    with BoundedExecutor(options.jobs, processes=True) as executor:
+        for (source, name) in sources:
+            destination = os.path.splitext(name)[0] + ".dzi"
+            if options.destination:
+                destination = os.path.join(options.destination, destination)
+            else:
+                destination = os.path.splitext(source)[0] + ".dzi"
+            executor.submit(
+                convert,
+                creator_options,
+                source,
+                destination,
+                options.profile,
+                callback=done(source, destination),
+            )
+    elapsed = max(time.time() - start, 1e-6)
+    print(
+        "%d created, %d up to date, %d failed in %.1fs"
+        % (totals["created"], totals["skipped"], totals["failed"], elapsed)
+    )
+    print(
+        "%.1f images/s, %.1f tiles/s, %.1f MB/s read"
+        % (
+            totals["created"] / elapsed,
+            totals["tiles"] / elapsed,
+            totals["bytes"] / elapsed / (1024 * 1024),
+        )
+    )
+    if stats is not None:
+        print_stats(stats)
+    if options.collection:
+        collection_stats = BuildStats() if options.profile else None
+        CollectionCreator(dedup=options.dedup).create(
+            destinations,
+            options.collection,
+            workers=options.jobs,
+            stats=collection_stats,
+        )
+        print("Created collection %s" % options.collection)
+        if collection_stats is not None:
+            print_stats(collection_stats)
+    return totals["failed"] == 0
+
+
+def parse_shard(value):
+    """Returns (shard, shards) from "INDEX/COUNT", or None if invalid."""
+    try:
+        shard, shards = (int(part) for part in value.split("/"))
+    except ValueError:
+        return None
+    if not 0 <= shard < shards:
+        return None
+    return (shard, shards)
+
+
+def run_shards(source, destination, shards, options):
+    """Runs every shard of a build as a process of this script, as separate
+    hosts would. Returns whether all shards succeeded."""
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--destination=%s" % destination,
+        "--image_quality=%r" % options.image_quality,
+        "--resize_filter=%s" % options.resize_filter,
+        "--encoder_preset=%s" % options.encoder_preset,
+        "--workers=%s" % options.workers,
+    ]
+    for name in ("tile_size", "tile_overlap", "tile_format"):
+        if getattr(options, name) is not None:
+            command.append("--%s=%s" % (name, getattr(options, name)))
+    if options.dedup:
+        command.append("--dedup")
+    if options.draft:
+        command.append("--draft")
+    if options.use_processes:
+        command.append("--processes")
+    processes = [
+        subprocess.Popen(command + ["--shard=%s/%s" % (shard, shards), source])
+        for shard in range(shards)
+    ]
+    return all([process.wait() == 0 for process in processes])
+
+
 def main():
-    parser = optparse.OptionParser(usage="Usage: %prog [options] filename")
+    parser = optparse.OptionParser(
+        usage="Usage: %prog [options] filename\n"
+        "       %prog [options] -b|--batch directory|glob|filename...\n"
+        "       %prog [options] -d destination filename.dzi|filename.dzp\n"
+        "       %prog [options] --merge count -d destination"
+    )
 
     parser.add_option(
         "-d",
         "--destination",
         dest="destination",
-        help="Set the destination of the output.",
+        help="Set the destination of the output. In batch mode, the directory "
+        "of the outputs. Default: next to the sources",
     )
     parser.add_option(
         "-s",
         "--tile_size",
         dest="tile_size",
         type="int",
-        default=254,
-        help="Size of the tiles. Default: 254",
+        help="Size of the tiles. Default: 254, or that of the source when "
+        "re-tiling",
     )
     parser.add_option(
         "-f",
         "--tile_format",
         dest="tile_format",
-        default=DEFAULT_IMAGE_FORMAT,
-        help="Image format of the tiles (jpg or png). Default: jpg",
+        help="Image format of the tiles (%s). Default: jpg, or that of the "
+        "source when re-tiling" % ", ".join(sorted(IMAGE_FORMATS)),
+    )
+    parser.add_option(
+        "-e",
+        "--encoder_preset",
+        dest="encoder_preset",
+        default="default",
+        help="Tile encoder options trading encoding speed for size (fast, "
+        "default or small). Default: default",
     )
     parser.add_option(
         "-o",
         "--tile_overlap",
         dest="tile_overlap",
         type="int",
-        default=1,
-        help="Overlap of the tiles in pixels (0-10). Default: 1",
+        help="Overlap of the tiles in pixels (0-10). Default: 1, or that of "
+        "the source when re-tiling",
     )
     parser.add_option(
         "-q",
@@ -49,33 +254,230 @@ def main():
         "-r",
         "--resize_filter",
         dest="resize_filter",
-        default=DEFAULT_RESIZE_FILTER,
+        default="antialias",
         help="Type of filter for resizing (bicubic, nearest, bilinear, antialias (best). Default: antialias",
     )
 
+    parser.add_option(
+        "--draft",
+        dest="draft",
+        action="store_true",
+        default=False,
+        help="Resize low levels of JPEG sources from reduced-scale decodes, "
+        "which is faster but slightly less accurate.",
+    )
+    parser.add_option(
+        "--dedup",
+        dest="dedup",
+        action="store_true",
+        default=False,
+        help="Encode tiles with identical pixels once and hard-link the "
+        "duplicates.",
+    )
+    parser.add_option(
+        "-u",
+        "--update",
+        dest="update",
+        metavar="X1,Y1,X2,Y2",
+        help="Only regenerate the tiles of the existing destination that "
+        "depend on the given rectangle of the edited source.",
+    )
+
+    parser.add_option(
+        "--shard",
+        dest="shard",
+        metavar="INDEX/COUNT",
+        help="Only create the given shard of the destination, such as 0/4, to "
+        "be merged with --merge once all shards are done.",
+    )
+    parser.add_option(
+        "--merge",
+        dest="merge",
+        type="int",
+        metavar="COUNT",
+        help="Complete the destination from its given number of shards.",
+    )
+    parser.add_option(
+        "--shards",
+        dest="shards",
+        type="int",
+        metavar="COUNT",
+        help="Create the given number of shards as local processes and merge "
+        "them.",
+    )
+
+    parser.add_option(
+        "-w",
+        "--workers",
+        dest="workers",
+        type="int",
+        default=1,
+        help="Number of workers encoding and writing tiles. Default: 1",
+    )
+    parser.add_option(
+        "-p",
+        "--processes",
+        dest="use_processes",
+        action="store_true",
+        default=False,
+        help="Use a process pool instead of a thread pool for the workers.",
+    )
+
+    parser.add_option(
+        "-b",
+        "--batch",
+        dest="batch",
+        action="store_true",
+        default=False,
+        help="Convert every image given as a file, a directory or a glob, "
+        "skipping outputs that are newer than their source and have the same "
+        "settings.",
+    )
+    parser.add_option(
+        "-l",
+        "--file-list",
+        dest="file_list",
+        help="In batch mode, also convert the images listed in a file, one per "
+        "line (- for standard input).",
+    )
+    parser.add_option(
+        "-j",
+        "--jobs",
+        dest="jobs",
+        type="int",
+        default=os.cpu_count() or 1,
+        help="In batch mode, number of images converted at once. "
+        "Default: number of CPUs",
+    )
+    parser.add_option(
+        "-c",
+        "--collection",
+        dest="collection",
+        help="In batch mode, also create a collection (DZC) of the outputs.",
+    )
+    parser.add_option(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=False,
+        help="Print the time spent in every phase and counts of levels, tiles "
+        "and bytes written.",
+    )
+    parser.add_option(
+        "--progress",
+        dest="progress",
+        action="store_true",
+        default=False,
+        help="Print the progress of every level.",
+    )
+
     (options, args) = parser.parse_args()
 
-    if not args:
+    if options.file_list:
+        options.batch = True
+    if not args and not options.batch and not options.merge:
         parser.print_help()
         sys.exit(1)
 
+    if options.resize_filter not in RESIZE_FILTERS:
+        options.resize_filter = None
+
+    creator_options = dict(
+        image_quality=options.image_quality,
+        resize_filter=options.resize_filter,
+        encoder_preset=options.encoder_preset,
+        dedup=options.dedup,
+        draft=options.draft,
+        workers=options.workers,
+        use_processes=options.use_processes,
+    )
+    # Left unset, the creator's defaults apply, or the source's when re-tiling
+    tile_options = dict(
+        (name, getattr(options, name))
+        for name in ("tile_size", "tile_overlap", "tile_format")
+        if getattr(options, name) is not None
+    )
+    creator_options.update(tile_options)
+
+    if options.batch:
+        sources = get_sources(args, options.file_list, options.destination)
+        if not sources:
+            parser.print_help()
+            sys.exit(1)
+        if not run_batch(sources, options, creator_options):
+            sys.exit(1)
+        return
+
+    if options.merge:
+        if not options.destination:
+            parser.error("Merging shards needs a --destination")
+        stats = BuildStats() if options.profile else None
+        progress = print_progress if options.progress else None
+        creator = ImageCreator(**creator_options)
+        creator.merge_shards(
+            options.destination, options.merge, progress=progress, stats=stats
+        )
+        if stats is not None:
+            print_stats(stats)
+        return
+
     source = args[0]
 
+    if source.endswith((".dzi", PACK_EXTENSION)):
+        # Re-tile an existing Deep Zoom image
+        if not options.destination:
+            parser.error("Re-tiling a Deep Zoom image needs a --destination")
+        stats = BuildStats() if options.profile else None
+        retile(
+            source,
+            options.destination,
+            image_quality=options.image_quality,
+            encoder_preset=options.encoder_preset,
+            workers=options.workers,
+            progress=print_progress if options.progress else None,
+            stats=stats,
+            **tile_options
+        )
+        if stats is not None:
+            print_stats(stats)
+        return
+
     if not options.destination:
         if os.path.exists(source):
             options.destination = os.path.splitext(source)[0] + ".dzi"
         else:
             options.destination = os.path.splitext(os.path.basename(source))[0] + ".dzi"
-    if options.resize_filter and options.resize_filter in RESIZE_FILTERS:
-        options.resize_filter = RESIZE_FILTERS[options.resize_filter]
 
-    creator = ImageCreator(
-        tile_size=options.tile_size,
-        tile_format=options.tile_format,
-        image_quality=options.image_quality,
-        resize_filter=options.resize_filter,
-    )
-    creator.create(source, options.destination)
+    stats = BuildStats() if options.profile else None
+    progress = print_progress if options.progress else None
+    creator = ImageCreator(**creator_options)
+    if options.shards:
+        if not run_shards(source, options.destination, options.shards, options):
+            sys.exit(1)
+        creator.merge_shards(
+            options.destination, options.shards, progress=progress, stats=stats
+        )
+    elif options.shard:
+        shard = parse_shard(options.shard)
+        if shard is None:
+            parser.error("--shard needs INDEX/COUNT, such as 0/4")
+        creator.create_shard(
+            source, options.destination, *shard, progress=progress, stats=stats
+        )
+    elif options.update:
+        try:
+            rect = tuple(int(value) for value in options.update.split(","))
+        except ValueError:
+            rect = ()
+        if len(rect) != 4:
+            parser.error("--update needs a rectangle X1,Y1,X2,Y2")
+        creator.update_region(
+            source, options.destination, rect, progress=progress, stats=stats
+        )
+    else:
+        creator.create(source, options.destination, progress=progress, stats=stats)
+    if stats is not None:
+        print_stats(stats)
 
 
 if __name__ == "__main__":
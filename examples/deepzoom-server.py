@@ -0,0 +1,55 @@
+import os
+import sys
+from wsgiref.simple_server import make_server
+
+from deepzoom import DeepZoomTileSource, DeepZoomWSGIApplication
+
+import optparse
+
+def main():
+    parser = optparse.OptionParser(usage="Usage: %prog [options] filename...")
+
+    parser.add_option(
+        "-p",
+        "--port",
+        dest="port",
+        type="int",
+        default=8000,
+        help="Port to listen on. Default: 8000",
+    )
+    parser.add_option(
+        "-s",
+        "--tile_size",
+        dest="tile_size",
+        type="int",
+        default=254,
+        help="Size of the tiles. Default: 254",
+    )
+    parser.add_option(
+        "-f",
+        "--tile_format",
+        dest="tile_format",
+        default="jpg",
+        help="Image format of the tiles (jpg or png). Default: jpg",
+    )
+
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.print_help()
+        sys.exit(1)
+
+    sources = {}
+    for source in args:
+        name = os.path.splitext(os.path.basename(source))[0]
+        sources[name] = DeepZoomTileSource(
+            source, tile_size=options.tile_size, tile_format=options.tile_format
+        )
+        print("http://localhost:%s/%s.dzi" % (options.port, name))
+
+    server = make_server("", options.port, DeepZoomWSGIApplication(sources))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+import PIL.Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, "examples", "deepzoom-cli.py")
+
+
+def run_cli(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run(
+        [sys.executable, CLI] + list(args),
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_batch_skips_its_own_output(tmp_path):
+    for name in ("a.jpg", "b.png"):
+        PIL.Image.new("RGB", (600, 400), "red").save(tmp_path / name)
+    output = tmp_path / "out"
+    for destination in ([], ["--destination", str(output)]):
+        for _ in range(3):
+            result = run_cli("--batch", *destination, str(tmp_path))
+        # Later runs find only the two sources, both up to date
+        assert "0 created, 2 up to date, 0 failed" in result.stdout
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".dzi")) == [
+        "a.dzi",
+        "b.dzi",
+    ]
+    assert sorted(name for name in os.listdir(output) if name.endswith(".dzi")) == [
+        "a.dzi",
+        "b.dzi",
+    ]
@@ -0,0 +1,59 @@
+import PIL.Image
+import pytest
+
+from deepzoom import CollectionCreator, DeepZoomCollection, ImageCreator
+from deepzoom.collection import DeepZoomCollectionItem
+
+
+@pytest.fixture
+def image(tmp_path):
+    PIL.Image.new("RGB", (500, 300), "blue").save(tmp_path / "a.png")
+    ImageCreator().create(str(tmp_path / "a.png"), str(tmp_path / "a.dzi"))
+    return str(tmp_path / "a.dzi")
+
+
+@pytest.mark.parametrize(
+    "tile_format, image_format", [("jpg", "JPEG"), ("jpeg", "JPEG"), ("tif", "TIFF")]
+)
+def test_save_tile_formats(tmp_path, image, tile_format, image_format):
+    collection = DeepZoomCollection(
+        str(tmp_path / "c.dzc"), tile_format=tile_format
+    )
+    collection.append(image)
+    collection.save()
+    tile = PIL.Image.open(tmp_path / "c_files" / "7" / ("0_0.%s" % tile_format))
+    assert tile.format == image_format
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_save_progress(tmp_path, image, workers):
+    collection = DeepZoomCollection(str(tmp_path / "c.dzc"))
+    collection.append(image)
+    calls = []
+    collection.save(workers=workers, progress=lambda *args: calls.append(args))
+    assert calls
+    assert all(level is None for (level, _, _) in calls)
+    assert calls[-1][1] == calls[-1][2]
+
+
+def test_create_progress(tmp_path):
+    PIL.Image.new("RGB", (500, 300), "blue").save(tmp_path / "a.png")
+    calls = []
+    CollectionCreator().create(
+        [str(tmp_path / "a.png")],
+        str(tmp_path / "c.dzc"),
+        progress=lambda *args: calls.append(args),
+    )
+    assert calls
+    assert all(level is None for (level, _, _) in calls)
+    assert calls[-1][1] == calls[-1][2]
+
+
+def test_existing_items_from_generator(tmp_path, image):
+    items = (DeepZoomCollectionItem(image, 500, 300, id=id) for id in range(3))
+    collection = DeepZoomCollection(str(tmp_path / "c.dzc"), items=items)
+    assert collection.next_item_id == 3
+    collection.save()
+    saved = DeepZoomCollection.from_file(str(tmp_path / "c.dzc"))
+    assert [item.id for item in saved.existing_items] == [0, 1, 2]
+    assert saved.next_item_id == 3
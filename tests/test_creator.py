@@ -0,0 +1,22 @@
+import PIL.Image
+
+from deepzoom import ImageCreator
+from deepzoom._encoder import encode_tile
+
+
+def test_update_region_in_other_format(tmp_path):
+    source = str(tmp_path / "a.png")
+    destination = str(tmp_path / "a.dzi")
+    PIL.Image.effect_noise((600, 400), 64).convert("RGB").save(source)
+    ImageCreator(tile_format="png").create(source, destination)
+    image = PIL.Image.open(source)
+    image.paste((0, 0, 255), (100, 100, 200, 150))
+    image.save(source)
+    # The "fast" preset of PNG, not that of JPEG, applies to the PNG tiles
+    creator = ImageCreator(tile_format="jpg", encoder_preset="fast")
+    creator.update_region(source, destination, (100, 100, 200, 150))
+    path = tmp_path / "a_files" / "10" / "0_0.png"
+    tile = PIL.Image.open(path)
+    assert tile.getpixel((150, 120)) == (0, 0, 255)
+    expected = encode_tile(tile, "png", 0.8, {"compress_level": 1})
+    assert path.read_bytes() == expected
@@ -0,0 +1,24 @@
+import PIL.Image
+import pytest
+
+from deepzoom import ImageCreator, retile
+from deepzoom._image_descriptor import DeepZoomImageDescriptor
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_progress(tmp_path, workers):
+    PIL.Image.new("RGB", (1000, 700), "green").save(tmp_path / "a.png")
+    ImageCreator().create(str(tmp_path / "a.png"), str(tmp_path / "a.dzi"))
+    calls = []
+    retile(
+        str(tmp_path / "a.dzi"),
+        str(tmp_path / "b.dzi"),
+        tile_size=128,
+        workers=workers,
+        progress=lambda *args: calls.append(args),
+    )
+    descriptor = DeepZoomImageDescriptor()
+    descriptor.open(str(tmp_path / "b.dzi"))
+    assert descriptor.tile_size == 128
+    assert {level for (level, _, _) in calls} == set(range(descriptor.num_levels))
+    assert calls[-1][1] == calls[-1][2]
@@ -0,0 +1,33 @@
+import io
+
+import PIL.Image
+
+from deepzoom import DeepZoomTileSource
+
+
+def test_uncached_levels_match_cached(monkeypatch):
+    image = PIL.Image.effect_mandelbrot((1200, 900), (-2, -1, 1, 1), 100)
+    image = image.convert("RGB")
+    cached = DeepZoomTileSource(image, tile_format="png")
+    # Levels up to 300 KB fit, but not the 600x450 level below the source
+    uncached = DeepZoomTileSource(image, tile_format="png", max_level_bytes=300000)
+    resized = []
+    get_level_image = uncached.get_level_image
+
+    def get_level_image_logged(level):
+        resized.append(level)
+        return get_level_image(level)
+
+    monkeypatch.setattr(uncached, "get_level_image", get_level_image_logged)
+    for level in range(cached.descriptor.num_levels):
+        columns, rows = cached.descriptor.get_num_tiles(level)
+        for column in range(columns):
+            for row in range(rows):
+                expected = cached.get_tile(level, column, row)
+                tile = uncached.get_tile(level, column, row)
+                assert (
+                    PIL.Image.open(io.BytesIO(tile)).tobytes()
+                    == PIL.Image.open(io.BytesIO(expected)).tobytes()
+                )
+    max_level = cached.descriptor.num_levels - 1
+    assert max_level - 1 not in resized